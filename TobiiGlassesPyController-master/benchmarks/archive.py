@@ -0,0 +1,81 @@
+# archive.py: Encode/decode throughput of the stream archive
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+import numpy as np
+
+from tobiiglassesctrl.archive import ArchiveWriter, ArchiveReader
+from tobiiglassesctrl.ingest import encode_records
+
+SECONDS = 600
+RUNS = 3
+
+
+def stream(seconds, freq=100):
+	"""Synthetic stream at the resolution of the device JSON: all channels at freq Hz, pts at 25 Hz."""
+	rng = np.random.RandomState(0)
+	for i in range(seconds * freq):
+		ts = i * (1000000 // freq)
+		yield {'ts': ts, 's': 0, 'gidx': i, 'l': 11321 + i % 7,
+			   'gp': [round(0.5 + 0.2 * np.sin(i / 80.0) + rng.normal(0, 0.005), 4), round(0.5 + rng.normal(0, 0.005), 4)]}
+		yield {'ts': ts, 's': 0, 'gidx': i, 'gp3': [round(v, 2) for v in rng.normal([-1.5, 69.4, 535.1], 2)]}
+		for eye in ('left', 'right'):
+			yield {'ts': ts + 1, 's': 0, 'gidx': i, 'eye': eye, 'pc': [round(v, 2) for v in rng.normal([-30.6, -22.3, -9.2], 0.1)]}
+			yield {'ts': ts + 1, 's': 0, 'gidx': i, 'eye': eye, 'pd': round(3.0 + rng.normal(0, 0.05), 2)}
+			yield {'ts': ts + 1, 's': 0, 'gidx': i, 'eye': eye, 'gd': [round(v, 4) for v in rng.normal([0.1, 0.13, 0.98], 0.01)]}
+		yield {'ts': ts + 2, 's': 0, 'ac': [round(v, 3) for v in rng.normal([-0.1, -9.8, 0.3], 0.05)]}
+		yield {'ts': ts + 3, 's': 0, 'gy': [round(v, 3) for v in rng.normal(0, 0.5, 3)]}
+		if i % 4 == 0:
+			yield {'ts': ts + 4, 's': 0, 'pts': i * 900, 'pv': 7}
+
+def best(f, runs=RUNS):
+	timings = []
+	for i in range(runs):
+		start = time.perf_counter()
+		f()
+		timings.append(time.perf_counter() - start)
+	return min(timings)
+
+def main():
+	seconds = int(sys.argv[1]) if len(sys.argv) > 1 else SECONDS
+	packets = list(stream(seconds))
+	json_size = sum(len(json.dumps(p)) + 1 for p in packets)
+	records = encode_records(packets)
+	mb = records.nbytes / 1e6
+	print("%d s of stream: %d packets, %.1f MB of JSON lines, %.1f MB of records" % (seconds, len(records), json_size / 1e6, mb))
+	path = os.path.join(tempfile.mkdtemp(), 'bench.tga')
+	for codec, level in (('zlib', 1), ('zlib', 6), ('lzma', 1), ('lzma', 6)):
+		def encode():
+			with ArchiveWriter(path, codec=codec, level=level) as writer:
+				writer.push_records(records)
+		def decode():
+			with ArchiveReader(path) as reader:
+				reader.read()
+		t_enc = best(encode)
+		t_dec = best(decode)
+		size = os.path.getsize(path)
+		print("%s-%d: %.2f MB (%.1fx smaller than JSON), encode %.1f MB/s, decode %.1f MB/s"
+			  % (codec, level, size / 1e6, json_size / float(size), mb / t_enc, mb / t_dec))
+	os.remove(path)
+
+if __name__ == '__main__':
+	main()
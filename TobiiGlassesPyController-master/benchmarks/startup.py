@@ -0,0 +1,47 @@
+# startup.py: Import and controller startup benchmark
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import sys
+import time
+import subprocess
+
+RUNS = 20
+
+IMPORT_SNIPPET = "import tobiiglassesctrl"
+CONSTRUCT_SNIPPET = "from tobiiglassesctrl import TobiiGlassesController; TobiiGlassesController('192.168.71.50', connect=False)"
+
+
+def run(snippet, runs=RUNS):
+	timings = []
+	for i in range(runs):
+		start = time.perf_counter()
+		subprocess.check_call([sys.executable, '-c', snippet])
+		timings.append(time.perf_counter() - start)
+	timings.sort()
+	return timings[len(timings) // 2]
+
+def main():
+	baseline = run("pass")
+	print("Interpreter startup:             %.1f ms" % (baseline * 1000))
+	print("import tobiiglassesctrl:         +%.1f ms" % ((run(IMPORT_SNIPPET) - baseline) * 1000))
+	print("TobiiGlassesController(connect=False): +%.1f ms" % ((run(CONSTRUCT_SNIPPET) - baseline) * 1000))
+	modules = subprocess.check_output([sys.executable, '-c', IMPORT_SNIPPET + "; import sys; print(' '.join(sorted(sys.modules)))"])
+	for name in ('netifaces', 'urllib.request', 'numpy'):
+		print("%s imported: %s" % (name, name in modules.decode('utf-8').split()))
+
+if __name__ == '__main__':
+	main()
@@ -18,16 +18,20 @@ setup(
     url='https://github.com/ddetommaso/TobiiGlassesPyController/',
     download_url='https://github.com/ddetommaso/TobiiGlassesPyController/archive/2.2.6.tar.gz',
     install_requires=['netifaces'],
+    python_requires='>=3.8',
+    extras_require={'analysis': ['numpy'], 'video': ['numpy', 'opencv-python']},
     author='Davide De Tommaso',
     author_email='dtmdvd@gmail.com',
     keywords=['eye-tracker','tobii','glasses', 'tobii pro glasses 2', 'tobii glasses', 'eye tracking'],
     packages=find_packages(exclude=['examples*']),
     classifiers = [
-                'Programming Language :: Python :: 2.7',
-                'Programming Language :: Python :: 3.5',
-                'Programming Language :: Python :: 3.6',
-                'Programming Language :: Python :: 3.7',
-                'Programming Language :: Python :: 3.8'
+                'Programming Language :: Python :: 3',
+                'Programming Language :: Python :: 3 :: Only',
+                'Programming Language :: Python :: 3.8',
+                'Programming Language :: Python :: 3.9',
+                'Programming Language :: Python :: 3.10',
+                'Programming Language :: Python :: 3.11',
+                'Programming Language :: Python :: 3.12'
 
     ],
 )
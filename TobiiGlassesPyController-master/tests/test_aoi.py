@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.aoi import AOIIndex, AOITracker, NO_AOI
+
+
+def test_hit_test_matches_brute_force():
+  rng = np.random.RandomState(0)
+  corners = rng.uniform(0, 1, size=(2000, 2))
+  rects = np.hstack([corners, corners + rng.uniform(0.01, 0.1, size=(2000, 2))])
+  index = AOIIndex(rects, grid=32)
+  xy = rng.uniform(-0.1, 1.1, size=(500, 2))
+  inside = ((rects[None, :, 0] <= xy[:, None, 0]) & (xy[:, None, 0] < rects[None, :, 2]) &
+            (rects[None, :, 1] <= xy[:, None, 1]) & (xy[:, None, 1] < rects[None, :, 3]))
+  expected = np.where(inside.any(axis=1), inside.argmax(axis=1), NO_AOI)
+  assert np.array_equal(index.hit_test(xy), expected)
+
+
+def test_dwell_entries_transitions():
+  index = AOIIndex([(0.0, 0.0, 0.5, 1.0), (0.5, 0.0, 1.0, 1.0)], ids=['left', 'right'])
+  tracker = AOITracker(index)
+  xs = [0.2, 0.2, 0.7, 0.7, 0.7, 1.5, 0.2, 0.2]
+  for i, x in enumerate(xs):
+    tracker.push({'ts': i * 10000, 's': 0, 'gp': [x, 0.5]})
+    if i == 3:
+      tracker.update()
+  tracker.update()
+  assert tracker.get_stats() == {'left': {'dwell': 30000, 'entries': 2},
+                                 'right': {'dwell': 30000, 'entries': 1}}
+  assert tracker.get_transition_matrix().tolist() == [[0, 1], [1, 0]]
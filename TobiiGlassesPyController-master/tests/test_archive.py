@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.archive import ArchiveWriter, ArchiveReader, QUANTUM
+from tobiiglassesctrl.ingest import encode_records
+from tobiiglassesctrl.packets import PACKET_KEYS
+
+
+def replayed_stream(n):
+  rng = np.random.RandomState(0)
+  for i in range(n):
+    ts = i * 10000
+    gp = [round(0.5 + 0.1 * np.sin(i / 50.0), 4), round(0.5 + rng.normal(0, 0.01), 4)]
+    yield {'ts': ts, 's': 0, 'gidx': i, 'l': 11321, 'gp': gp}
+    for eye in ('left', 'right'):
+      yield {'ts': ts + 1, 's': 0 if i % 97 else 1, 'gidx': i, 'eye': eye, 'pd': round(3 + rng.normal(0, 0.05), 2)}
+    yield {'ts': ts + 2, 's': 0, 'ac': [round(v, 3) for v in rng.normal(0, 1, 3)]}
+    if i % 4 == 0:
+      yield {'ts': ts + 3, 's': 0, 'pts': i * 900, 'pv': 7}
+    if i % 20 == 0:
+      yield {'ts': ts + 4, 's': 0, 'gidx': i, 'gp3': [np.nan, 69.43, 535.1]}
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_round_trip_and_time_ranges(tmp_path, codec):
+  packets = list(replayed_stream(3000))
+  records = encode_records(packets)
+  path = str(tmp_path / 'stream.tga')
+  with ArchiveWriter(path, codec=codec, block_records=2000) as writer:
+    for packet in packets[:5000]:
+      writer.push(packet)
+    writer.push_records(records[5000:])
+  with ArchiveReader(path) as reader:
+    assert len(reader) == len(records) and len(reader.index) > 5
+    assert reader.get_ts_range() == (0, 29990002)
+    decoded = reader.read()
+    for name in ('ts', 'gidx', 'iv', 's', 'ch', 'eye'):
+      assert np.array_equal(decoded[name], records[name])
+    for ch in np.unique(records['ch']):
+      mask = records['ch'] == ch
+      quantum = QUANTUM[PACKET_KEYS[ch - 1]]
+      assert np.allclose(decoded['v'][mask], records['v'][mask], atol=quantum / 2, equal_nan=True)
+    assert np.array_equal(np.isnan(decoded['l']), np.isnan(records['l']))
+    window = reader.read(10000000, 12000000, keys=['gp'])
+    assert np.array_equal(window['ts'], np.arange(1000, 1201) * 10000)
+    packets = list(reader.iter_packets(0, 0))
+    assert packets == [{'ts': 0, 's': 0, 'gidx': 0, 'l': 11321.0, 'gp': [0.5, packets[0]['gp'][1]]}]
+  assert len(open(path, 'rb').read()) < records.nbytes / 4
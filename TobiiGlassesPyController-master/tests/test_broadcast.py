@@ -0,0 +1,71 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from tobiiglassesctrl.broadcast import BroadcastServer, BroadcastClient
+
+
+def wait_for(condition, timeout=5.0):
+  deadline = time.time() + timeout
+  while not condition() and time.time() < deadline:
+    time.sleep(0.01)
+  return condition()
+
+
+def test_replayed_stream_reaches_all_clients():
+  address = os.path.join(tempfile.mkdtemp(), 'tobii.sock')
+  for addr in [('127.0.0.1', 0), address]:
+    with BroadcastServer(address=addr) as server:
+      clients = [BroadcastClient(server.address) for i in range(3)]
+      assert wait_for(lambda: len(server.clients) == 3)
+      received = []
+      clients[0].add_data_listener(received.append)
+      for ts in range(1, 501):
+        server.push({'ts': ts, 's': 0, 'gidx': ts, 'l': 2.0, 'gp': [0.25, 0.5]})
+        server.push({'ts': ts, 's': 0, 'gidx': ts, 'eye': 'left', 'pd': 3.5})
+      server.push({'ts': 501, 's': 0, 'type': 'event', 'tag': ''})
+      assert wait_for(lambda: all(c.get_data()['left_eye']['pd']['ts'] == 500 for c in clients))
+      for client in clients:
+        assert client.get_data()['gp'] == {'ts': 500, 's': 0, 'gidx': 500, 'l': 2.0, 'gp': [0.25, 0.5]}
+        client.close()
+      assert len(received) == 1000
+  assert not os.path.exists(address)
+
+
+def test_slow_client_drops_oldest_records():
+  with BroadcastServer(max_queue=100) as server:
+    stalled = socket.create_connection(server.address)
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    assert wait_for(lambda: len(server.clients) == 1)
+    start = time.time()
+    for ts in range(100000):
+      server.push({'ts': ts, 's': 0, 'gp': [0.5, 0.5]})
+    assert time.time() - start < 10
+    assert wait_for(lambda: list(server.get_stats().values())[0]['dropped'] > 0)
+    stalled.close()
+
+
+def test_failed_connect_releases_the_socket():
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listener.bind(('127.0.0.1', 0))
+  listener.listen(1)
+
+  def serve():
+    conn, peer = listener.accept()
+    conn.sendall(b'HTTP/1.1')
+    conn.close()
+
+  t = threading.Thread(target=serve)
+  t.start()
+  try:
+    with pytest.raises(ValueError):
+      with BroadcastClient(listener.getsockname(), connect=False, timeout=1.0) as client:
+        client.connect()
+    assert client.sock is None and client.thread is None
+  finally:
+    t.join()
+    listener.close()
@@ -0,0 +1,41 @@
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tobiiglassesctrl import TobiiGlassesController
+
+
+class FakeCalibration(BaseHTTPRequestHandler):
+  done_at = 0
+  requests = []
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    self.requests.append(self.path)
+    state = 'calibrated' if time.time() >= self.done_at else 'calibrating'
+    body = json.dumps({'ca_id': 'ca1', 'ca_state': state}).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def test_calibration_polls_at_poll_interval():
+  server = HTTPServer(('127.0.0.1', 0), FakeCalibration)
+  t = threading.Thread(target=server.serve_forever)
+  t.daemon = True
+  t.start()
+  try:
+    tobiiglasses = TobiiGlassesController('127.0.0.1', connect=False)
+    tobiiglasses.base_url = 'http://127.0.0.1:%d' % server.server_port
+    tobiiglasses.poll_interval = 0.1
+    FakeCalibration.done_at = time.time() + 0.5
+    assert tobiiglasses.wait_until_calibration_is_done('ca1') is True
+    # About one request per poll_interval while calibrating
+    assert 5 <= len(FakeCalibration.requests) <= 8
+  finally:
+    server.shutdown()
@@ -0,0 +1,59 @@
+import gzip
+import json
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from tobiiglassesctrl.catalog import SessionCatalog
+
+
+def write_recording(project_dir, rec_id, participant, n, lost, freq=None):
+  rec_dir = os.path.join(project_dir, 'recordings', rec_id)
+  os.makedirs(os.path.join(rec_dir, 'segments', '1'))
+  with open(os.path.join(rec_dir, 'recording.json'), 'w') as f:
+    json.dump({'rec_id': rec_id, 'rec_info': {'Name': rec_id}, 'rec_participant': participant,
+               'rec_calibration': 'ca1', 'rec_created': '2020-01-0%sT10:00:00' % rec_id[-1]}, f)
+  if freq is not None:
+    with open(os.path.join(rec_dir, 'sysinfo.json'), 'w') as f:
+      json.dump({'sys_et_freq': freq}, f)
+  with gzip.open(os.path.join(rec_dir, 'segments', '1', 'livedata.json.gz'), 'wt') as f:
+    for i in range(n):
+      f.write(json.dumps({'ts': i * 10000, 's': 1 if i < lost else 0, 'gp': [0.5, 0.5]}) + '\n')
+  return rec_dir
+
+
+def test_scan_query_and_incremental_update(tmp_path):
+  project_dir = str(tmp_path / 'projects' / 'pr1')
+  for pa_id, name in [('pa1', 'alice'), ('pa2', 'bob')]:
+    os.makedirs(os.path.join(project_dir, 'participants', pa_id))
+    with open(os.path.join(project_dir, 'participants', pa_id, 'participant.json'), 'w') as f:
+      json.dump({'pa_id': pa_id, 'pa_project': 'pr1', 'pa_info': {'Name': name}}, f)
+  os.makedirs(os.path.join(project_dir, 'calibrations', 'ca1'))
+  with open(os.path.join(project_dir, 'calibrations', 'ca1', 'calibration.json'), 'w') as f:
+    json.dump({'ca_id': 'ca1', 'ca_state': 'calibrated'}, f)
+  with open(os.path.join(project_dir, 'project.json'), 'w') as f:
+    json.dump({'pr_id': 'pr1', 'pr_info': {'Name': 'study'}}, f)
+  lossy = write_recording(project_dir, 'rec1', 'pa1', 1000, 100)
+  write_recording(project_dir, 'rec2', 'pa1', 1000, 10, freq=100)
+  write_recording(project_dir, 'rec3', 'pa2', 500, 0, freq=50)
+
+  with SessionCatalog(str(tmp_path / 'catalog.db')) as catalog:
+    assert catalog.scan(str(tmp_path)) == 3
+    assert catalog.scan(str(tmp_path)) == 0
+    rows = catalog.find(participant='alice', et_freq=100, min_loss_rate=0.05)
+    assert [r['rec_id'] for r in rows] == ['rec1']
+    row = rows[0]
+    assert row['project_name'] == 'study' and row['calibration_state'] == 'calibrated'
+    assert row['gp_samples'] == 1000 and row['gp_valid'] == 900
+    assert abs(row['duration'] - 9.99) < 1e-9
+    assert catalog.get_files(row['path']) == {'livedata': [os.path.join(lossy, 'segments', '1', 'livedata.json.gz')]}
+    assert catalog.get_channels(row['path']) == {'gp': {'samples': 1000, 'valid': 900}}
+    assert [r['rec_id'] for r in catalog.find(project='pr1', max_loss_rate=0.05)] == ['rec2', 'rec3']
+
+    with gzip.open(os.path.join(lossy, 'segments', '1', 'livedata.json.gz'), 'wt') as f:
+      f.write(json.dumps({'ts': 0, 's': 0, 'gp': [0.5, 0.5]}) + '\n')
+    os.utime(os.path.join(lossy, 'segments', '1', 'livedata.json.gz'), (1, 1))
+    assert catalog.scan(str(tmp_path)) == 1
+    assert catalog.find(participant='pa1', min_loss_rate=0.05) == []
@@ -0,0 +1,34 @@
+import random
+
+from tobiiglassesctrl.clocksync import ClockSync, SYNC_EVENT_TYPE
+
+
+class FakeController(object):
+
+  def __init__(self):
+    self.events = []
+
+  def send_custom_event(self, event_type, event_tag=''):
+    self.events.append((event_type, event_tag))
+
+
+def test_offset_drift_and_round_trips():
+  rng = random.Random(0)
+  offset, drift, latency = 5e9, 20e-6, 300.0
+  host_us = lambda ts: ts * (1 + drift) + offset
+  sync = ClockSync(window=500000)
+  for i in range(6000):
+    ts = i * 10000
+    # Delays of at least latency us, some packets much later
+    delay = latency + rng.expovariate(1 / 2000.0)
+    sync.push({'ts': ts, 's': 0, 'gp': [0.5, 0.5]}, (host_us(ts) + delay) * 1e-6)
+  controller = FakeController()
+  tag = sync.send_event(controller)
+  assert controller.events == [(SYNC_EVENT_TYPE, tag)]
+  # Symmetric round trip of 2 * latency around the device stamp
+  ts = 60000000
+  sync.pending[tag] = (host_us(ts) - latency) * 1e-6
+  sync.push({'ts': ts, 's': 0, 'type': SYNC_EVENT_TYPE, 'tag': tag}, (host_us(ts) + latency) * 1e-6)
+  assert abs(sync.get_drift() - drift) < 2e-6
+  assert abs(sync.device_ts_to_host(ts) - host_us(ts) * 1e-6) < 50e-6
+  assert abs(sync.host_to_device_ts(sync.device_ts_to_host(123456789)) - 123456789) < 1e-3
@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.drift import DriftCorrector
+
+
+def test_affine_drift_is_removed_and_versioned():
+  rng = np.random.RandomState(0)
+  targets = rng.uniform(0.1, 0.9, size=(9, 2))
+  # Drifted gaze: scaled, shifted and slightly noisy
+  gaze = targets * [1.05, 0.97] + [0.03, -0.02] + rng.normal(0, 0.002, size=(9, 2))
+  drift = DriftCorrector()
+  assert drift.fit() is None
+  for i, (target, g) in enumerate(zip(targets, gaze)):
+    drift.add_fixation(target, (i * 1000000, 300000, g[0], g[1]))
+  assert drift.fit() == 1
+  assert np.abs(drift.apply(gaze) - targets).max() < 0.01
+  for i in range(5):
+    drift.push({'ts': i, 's': 0, 'gp': list(gaze[i])})
+  ts, xy, version = drift.update()
+  assert version == 1 and np.array_equal(ts, np.arange(5))
+  assert np.allclose(xy, drift.apply(gaze[:5]))
+  state = json.loads(json.dumps(drift.get_state()))
+  drift.rollback(0)
+  assert np.allclose(drift.apply(gaze), gaze)
+  restored = DriftCorrector()
+  restored.set_state(state)
+  assert restored.get_version() == 1
+  assert np.allclose(restored.apply(gaze), drift.apply(gaze, version=1))
@@ -0,0 +1,18 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.export import export_packets, load_export
+
+
+def test_npz_export_roundtrip(tmp_path):
+  packets = []
+  for i in range(250):
+    packets.append({'ts': i * 10, 's': 0, 'gidx': i, 'l': 5.0, 'gp': [0.1, 0.2]})
+    packets.append({'ts': i * 10 + 1, 's': 0, 'gidx': i, 'eye': 'right', 'pd': 3.5})
+  path = export_packets(packets, str(tmp_path / 'session.npz'), fmt='npz', chunk_size=64)
+  tables = load_export(path)
+  assert sorted(tables) == ['gp', 'pd']
+  assert np.array_equal(tables['gp']['ts'], np.arange(250) * 10)
+  assert np.all(tables['gp']['x'] == 0.1) and np.all(tables['gp']['l'] == 5.0)
+  assert np.all(tables['pd']['pd'] == 3.5) and np.all(tables['pd']['eye'] == 2)
@@ -0,0 +1,54 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.heatmap import GazeHeatmap, Scanpath
+
+
+def test_binning_decay_and_merge():
+  heatmap = GazeHeatmap(width=10, height=10)
+  for i in range(100):
+    heatmap.push({'ts': i * 10000, 's': 0, 'gp': [0.25, 0.75]})
+  heatmap.push({'ts': 0, 's': 1, 'gp': [0.55, 0.55]})
+  other = GazeHeatmap(width=10, height=10)
+  other.add_batch([[0.55, 0.55]] * 50)
+  heatmap.merge(other)
+  counts = heatmap.get_counts()
+  assert counts[7, 2] == 100 and counts[5, 5] == 50 and counts.sum() == 150
+  image = heatmap.render(sigma=1.0)
+  assert image.max() == 1.0 and image[7, 2] == 1.0 and 0 < image[6, 2] < 1
+
+  live = GazeHeatmap(width=10, height=10, half_life=1.0)
+  live.add_batch([[0.05, 0.05]], ts=[0])
+  live.add_batch([[0.95, 0.95]], ts=[1000000])
+  assert np.allclose(live.get_counts()[0, 0], 0.5) and np.allclose(live.get_counts()[9, 9], 1.0)
+
+
+def test_decay_across_long_gaps():
+  live = GazeHeatmap(width=10, height=10, half_life=5.0)
+  ts = 0
+  expected = np.zeros((10, 10))
+  # Gaps of 200 half-lives push the lazy scale past its bound every few batches
+  for i in range(10):
+    live.add_batch([[0.05, 0.05], [0.95, 0.95]], ts=[ts, ts + 500000])
+    expected *= 0.5 ** (1000.0 / 5.0 + 0.1)
+    expected[0, 0] += 0.5 ** 0.1
+    expected[9, 9] += 1.0
+    ts += 1000000000
+  counts = live.get_counts()
+  assert np.isfinite(counts).all() and np.allclose(counts, expected)
+  # Resume after a 2 h pause
+  live.add_batch([[0.55, 0.55]], ts=[ts + 7200000000])
+  counts = live.get_counts()
+  assert counts[5, 5] == 1.0 and counts.sum() == 1.0
+
+
+def test_scanpath_fixations():
+  scanpath = Scanpath(max_dispersion=0.05, min_duration=100000)
+  for i in range(60):
+    x = 0.2 if i < 30 else 0.8
+    scanpath.push({'ts': i * 10000, 's': 0, 'gp': [x, 0.5]})
+  scanpath.push({'ts': 600000, 's': 0, 'gp': [0.2, 0.2]})
+  fixations = scanpath.get_fixations()
+  assert [(f[0], f[1]) for f in fixations] == [(0, 290000), (300000, 290000)]
+  assert np.allclose([f[2] for f in fixations], [0.2, 0.8])
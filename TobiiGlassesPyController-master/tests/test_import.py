@@ -2,3 +2,16 @@ import pytest
 
 def test_import():
   import tobiiglassesctrl
+
+def test_deferred_connect():
+  import sys
+  import logging
+  from tobiiglassesctrl import TobiiGlassesController
+  root = logging.getLogger()
+  level, handlers = root.level, list(root.handlers)
+  tobiiglasses = TobiiGlassesController("192.168.71.50", connect=False)
+  assert tobiiglasses.get_data()['gp']['ts'] == -1
+  assert 'netifaces' not in sys.modules
+  # The library must leave the logging configuration to the application
+  assert root.level == level and root.handlers == handlers
+  tobiiglasses.close()
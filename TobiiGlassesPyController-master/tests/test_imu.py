@@ -0,0 +1,42 @@
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.imu import HeadMotionEstimator, SCENE_HFOV
+
+
+def reference_filter(a, ts, gy, pitch_acc, state, last_ts):
+  out = []
+  for t, w, tilt in zip(ts, gy, pitch_acc):
+    state = a * (state + w * (t - last_ts) * 1e-6) + (1 - a) * tilt
+    last_ts = t
+    out.append(state)
+  return np.array(out)
+
+
+def test_batch_filter_matches_sequential():
+  rng = np.random.RandomState(0)
+  head = HeadMotionEstimator(chunk=64)
+  ts = np.arange(1, 501) * 10000.0
+  gy = rng.normal(0, 20, size=(500, 3))
+  tilt = rng.uniform(-30, 30, size=500)
+  ac = np.column_stack([np.zeros(500), 9.81 * np.cos(np.radians(tilt)), -9.81 * np.sin(np.radians(tilt))])
+  out = np.vstack([head.process(ts[:200], gy[:200], ac[:200]), head.process(ts[200:], gy[200:], ac[200:])])
+  expected = reference_filter(head.a, ts, gy[:, 0], tilt, tilt[0], ts[0])
+  assert np.allclose(out[:, 1], expected)
+  assert np.allclose(out[:, 3], np.cumsum(gy[:, 1] * np.diff(np.concatenate(([ts[0]], ts))) * 1e-6))
+
+
+def test_yaw_compensation_from_packets():
+  head = HeadMotionEstimator()
+  for i in range(101):
+    head.push({'ts': i * 10000, 's': 0, 'ac': [0.0, 9.81, 0.0]})
+    head.push({'ts': i * 10000 + 5, 's': 0, 'gy': [0.0, 10.0, 0.0]})
+  head.update()
+  orientation = head.get_orientation()
+  assert math.isclose(orientation['yaw'], 10.0, rel_tol=1e-3)
+  assert abs(orientation['pitch']) < 1e-6
+  xy = head.compensate([1000005], [[0.5, 0.5]])
+  assert np.allclose(xy, [[0.5 - orientation['yaw'] / SCENE_HFOV, 0.5]])
@@ -0,0 +1,105 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from tobiiglassesctrl.packets import RECORD, encode_packet, decode_record, slot_index
+from tobiiglassesctrl.ingest import SampleRing, ProcessIngest
+
+
+def test_record_roundtrip():
+  for packet in [{'ts': 10, 's': 0, 'gidx': 3, 'l': 1.5, 'gp': [0.25, 0.5]},
+                 {'ts': 11, 's': 0, 'gidx': 4, 'eye': 'left', 'pd': 4.25},
+                 {'ts': 12, 's': 0, 'pts': 900, 'pv': 7},
+                 {'ts': 13, 's': 0, 'ac': [0.1, -9.8, 0.2]}]:
+    assert decode_record(encode_packet(packet)) == packet
+
+
+def test_ring_latest_and_window():
+  np = pytest.importorskip('numpy')
+  ring = SampleRing(capacity=4, create=True)
+  try:
+    for ts in range(10):
+      ring.write({'ts': ts, 's': 0 if ts != 9 else 1, 'gp': [ts / 10.0, 0.0]})
+    assert ring.get_data()['gp']['ts'] == 8
+    window = ring.get_window(slot_index('gp'), 10)
+    assert list(window['ts']) == [6, 7, 8, 9]
+    records, seq = ring.read_since(slot_index('gp'), 7)
+    assert list(records['ts']) == [7, 8, 9] and seq == 10
+    del window
+  finally:
+    ring.close()
+
+
+def test_read_since_with_concurrent_writes():
+  np = pytest.importorskip('numpy')
+  ring = SampleRing(capacity=16, create=True)
+  slot = slot_index('gp')
+  try:
+    for ts in range(10):
+      ring.write({'ts': ts, 's': 0, 'gp': [0.5, 0.5]})
+    count = ring.count
+    calls = []
+
+    def producer_count(slot):
+      # The producer writes right after the reader loads the counter
+      value = count(slot)
+      if not calls:
+        for ts in range(10, 13):
+          ring.write({'ts': ts, 's': 0, 'gp': [0.5, 0.5]})
+      calls.append(value)
+      return value
+
+    ring.count = producer_count
+    records, seq = ring.read_since(slot, 5)
+    assert list(records['ts']) == [5, 6, 7, 8, 9] and seq == 10
+    records, seq = ring.read_since(slot, seq)
+    assert list(records['ts']) == [10, 11, 12] and seq == 13
+    del records
+  finally:
+    ring.close()
+
+
+def test_read_since_a_full_ring_behind():
+  np = pytest.importorskip('numpy')
+  ring = SampleRing(capacity=4, create=True)
+  slot = slot_index('gp')
+  try:
+    for ts in range(4):
+      ring.write({'ts': ts, 's': 0, 'gp': [0.5, 0.5]})
+    # The producer is storing the next record over ts 0, the counter is not bumped yet
+    RECORD.pack_into(ring.shm.buf, ring.__slot_record_offset__(slot, 4), *encode_packet({'ts': 99, 's': 0, 'gp': [0.5, 0.5]}))
+    records, seq = ring.read_since(slot, 0)
+    assert list(records['ts']) == [1, 2, 3] and seq == 4
+    del records
+  finally:
+    ring.close()
+
+
+def test_process_ingest():
+  device = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  device.bind(('127.0.0.1', 0))
+  device.settimeout(5.0)
+  peer = device.getsockname()
+
+  def serve():
+    msg, client = device.recvfrom(1024)
+    assert json.loads(msg.decode('utf-8'))['op'] == 'start'
+    for ts in range(1, 101):
+      device.sendto(json.dumps({'ts': ts, 's': 0, 'gidx': ts, 'gp': [0.5, 0.5]}).encode('utf-8'), client)
+
+  t = threading.Thread(target=serve)
+  t.start()
+  ingest = ProcessIngest(peer, None, '{"type": "live.data.unicast", "key": "test", "op": "start"}')
+  ingest.start()
+  try:
+    t.join()
+    deadline = time.time() + 5.0
+    while ingest.get_data()['gp']['ts'] < 100 and time.time() < deadline:
+      time.sleep(0.01)
+    assert ingest.get_data()['gp'] == {'ts': 100, 's': 0, 'gidx': 100, 'gp': [0.5, 0.5]}
+  finally:
+    ingest.close()
+    device.close()
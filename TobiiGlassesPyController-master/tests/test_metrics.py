@@ -0,0 +1,24 @@
+from tobiiglassesctrl import TobiiGlassesController
+from tobiiglassesctrl.metrics import Metrics, endpoint_name
+
+
+def test_metrics_export():
+  metrics = Metrics()
+  for i in range(100):
+    metrics.observe_packet(1e-3, 20e-6, 5e-6, 1e-6, 120)
+  metrics.observe('http_get', 0.05, endpoint_name('/api/recordings/abc123/status'))
+  stages = metrics.get_metrics()['stages']
+  assert stages['decode']['count'] == 100
+  assert 16e-6 <= stages['decode']['p50'] <= 32e-6
+  assert 'http_get /api/recordings/:id/status' in stages
+  assert metrics.get_metrics()['counters'] == {'packets': 100, 'bytes': 12000}
+  text = metrics.to_prometheus()
+  assert 'tobiiglassesctrl_stage_seconds_count{stage="recv"} 100' in text
+  assert 'tobiiglassesctrl_packets_total 100' in text
+
+
+def test_metrics_disabled_by_default():
+  tobiiglasses = TobiiGlassesController("192.168.71.50", connect=False)
+  assert tobiiglasses.get_metrics() == {}
+  tobiiglasses.enable_metrics()
+  assert tobiiglasses.get_metrics() == {'stages': {}, 'counters': {}}
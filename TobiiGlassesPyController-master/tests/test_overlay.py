@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.ingest import encode_records
+from tobiiglassesctrl.overlay import frame_timestamps, gaze_samples, gaze_at, OverlayRenderer
+
+
+def recorded(n, offset=1000000):
+  packets = []
+  for i in range(n):
+    ts = offset + i * 10000
+    packets.append({'ts': ts, 's': 0 if i % 50 else 1, 'gidx': i, 'gp': [i / float(n), 0.5]})
+    if i % 10 == 0:
+      # Scene video time runs 200 ms behind the device ts
+      packets.append({'ts': ts, 's': 0, 'vts': ts - offset - 200000})
+  return encode_records(packets)
+
+
+def test_frames_are_aligned_on_the_sync_packets():
+  records = recorded(500)
+  frame_ts = frame_timestamps(records, np.arange(100) * 40000.0)
+  assert np.array_equal(frame_ts, 1200000 + np.arange(100) * 40000)
+  gp_ts, gp_xy = gaze_samples(records)
+  assert len(gp_ts) == 490
+  xy = gaze_at(gp_ts, gp_xy, [1205000, 1500000, 7000000])
+  assert np.allclose(xy[0], [20.5 / 500, 0.5])
+  # The sample at 1500000 (i = 50) is invalid: interpolated across the gap
+  assert np.allclose(xy[1], [50 / 500.0, 0.5])
+  assert np.isnan(xy[2]).all()
+
+
+def test_render_segments(tmp_path):
+  cv2 = pytest.importorskip('cv2')
+  video = str(tmp_path / 'scene.avi')
+  writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*'MJPG'), 25, (160, 90))
+  for i in range(100):
+    writer.write(np.full((90, 160, 3), i, dtype=np.uint8))
+  writer.release()
+  output = str(tmp_path / 'overlay.avi')
+  stats = OverlayRenderer(workers=2, segment_frames=30, radius=5, fourcc='MJPG').render(video, recorded(500), output)
+  assert stats['frames'] == 100 and stats['segments'] == 4 and stats['fps'] > 0
+  cap = cv2.VideoCapture(output)
+  assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 100
+  cap.release()
@@ -0,0 +1,43 @@
+import gzip
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.recording import RecordingReader, recording_segments
+
+
+def write_segment(path, start, n):
+  os.makedirs(os.path.dirname(path))
+  with gzip.open(path, 'wt') as f:
+    for i in range(start, start + n):
+      f.write(json.dumps({'ts': i * 10000, 's': 0, 'gidx': i, 'l': 2, 'gp': [0.5, 0.5]}) + '\n')
+      f.write(json.dumps({'ts': i * 10000 + 5, 's': 0, 'gidx': i, 'eye': 'left', 'pd': 3.0}) + '\n')
+      if i % 100 == 0:
+        f.write(json.dumps({'ts': i * 10000 + 7, 's': 0, 'ets': 1, 'type': 'ev', 'tag': ''}) + '\n')
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_time_range_queries(tmp_path, workers):
+  write_segment(str(tmp_path / 'segments' / '2' / 'livedata.json.gz'), 5000, 5000)
+  write_segment(str(tmp_path / 'segments' / '1' / 'livedata.json.gz'), 0, 5000)
+  with RecordingReader(str(tmp_path), workers=workers, block_size=16 * 1024) as reader:
+    for f in reader.files:
+      f.checkpoint_interval = 64 * 1024
+    assert reader.get_ts_range() == (0, 99990005)
+    assert len(reader.read()) == 20000
+    gp = reader.read(40000000, 60000000, keys=['gp'])
+    assert np.array_equal(gp['ts'], np.arange(4000, 6001) * 10000)
+    assert len(reader.files[0].checkpoints) > 1
+    packets = list(reader.iter_packets(10000, 10005))
+    assert packets == [{'ts': 10000, 's': 0, 'gidx': 1, 'l': 2.0, 'gp': [0.5, 0.5]},
+                       {'ts': 10005, 's': 0, 'gidx': 1, 'eye': 'left', 'pd': 3.0}]
+
+
+def test_segments_order(tmp_path):
+  for name in ['10', 'tmp', '2']:
+    write_segment(str(tmp_path / 'segments' / name / 'livedata.json.gz'), 0, 1)
+  segments = recording_segments(str(tmp_path))
+  assert [os.path.basename(os.path.dirname(p)) for p in segments] == ['2', '10', 'tmp']
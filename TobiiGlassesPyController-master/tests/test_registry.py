@@ -0,0 +1,57 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tobiiglassesctrl import TobiiGlassesController
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+  objects = {'projects': [], 'participants': []}
+  requests = []
+
+  def log_message(self, *args):
+    pass
+
+  def reply(self, data):
+    body = json.dumps(data).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    self.requests.append(('GET', self.path))
+    self.reply(self.objects[self.path.split('/')[2]])
+
+  def do_POST(self):
+    self.requests.append(('POST', self.path))
+    data = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+    collection = self.path.split('/')[2]
+    data[collection[:2] + '_id'] = '%s%d' % (collection[:2], len(self.objects[collection]))
+    self.objects[collection].append(data)
+    self.reply(data)
+
+
+def test_registry_lookups():
+  FakeAPI.objects['projects'] = [{'pr_id': 'pr%d' % i, 'pr_info': {'Name': 'Study %d' % i}} for i in range(1000)]
+  server = HTTPServer(('127.0.0.1', 0), FakeAPI)
+  t = threading.Thread(target=server.serve_forever)
+  t.daemon = True
+  t.start()
+  try:
+    tobiiglasses = TobiiGlassesController('127.0.0.1', connect=False)
+    tobiiglasses.base_url = 'http://127.0.0.1:%d' % server.server_port
+    assert tobiiglasses.create_project('Study 999') == 'pr999'
+    project_id = tobiiglasses.create_project('New study')
+    assert tobiiglasses.create_project('New study') == project_id
+    names = ['P%02d' % i for i in range(20)]
+    ids = tobiiglasses.create_participants(project_id, names + names[:3])
+    assert ids[:3] == ids[-3:] and len(set(ids)) == 20
+    assert tobiiglasses.create_participant(project_id, 'P05') == ids[5]
+    assert FakeAPI.requests.count(('GET', '/api/projects')) == 1
+    assert FakeAPI.requests.count(('GET', '/api/participants')) == 1
+    assert FakeAPI.requests.count(('POST', '/api/participants')) == 20
+    assert len(tobiiglasses.get_registry().children('participants', project_id)) == 20
+  finally:
+    server.shutdown()
@@ -0,0 +1,31 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tobiiglassesctrl.resample import GazeResampler
+
+
+def packets(gidx, ts, right_valid=True):
+  yield {'ts': ts, 's': 0, 'gidx': gidx, 'l': 10, 'gp': [gidx / 100.0, 0.5]}
+  for eye, s in (('left', 0), ('right', 0 if right_valid else 1)):
+    yield {'ts': ts + 100, 's': s, 'gidx': gidx, 'eye': eye, 'pc': [0.0, 0.0, 0.0]}
+    yield {'ts': ts + 200, 's': s, 'gidx': gidx, 'eye': eye, 'pd': 4.0 if eye == 'left' else 5.0}
+    yield {'ts': ts + 300, 's': s, 'gidx': gidx, 'eye': eye, 'gd': [0.0, 0.0, 1.0]}
+
+
+def test_resample_and_fuse():
+  resampler = GazeResampler(rate=100, delay=0)
+  blocks = []
+  for gidx in range(50):
+    for packet in packets(gidx, 1000000 + gidx * 20000, right_valid=gidx < 25):
+      resampler.push(packet)
+    if gidx % 10 == 9:
+      blocks.append(resampler.pull())
+  block = np.concatenate(blocks)
+  assert np.all(np.diff(block['ts']) == 10000)
+  assert len(block) == 99
+  assert np.allclose(block['gp'][:, 0], np.arange(99) / 200.0)
+  assert block['gp_valid'].all() and block['left_valid'].all()
+  assert np.allclose(block['pd'][block['right_valid']], 4.5)
+  assert np.allclose(block['pd'][~block['right_valid']], 4.0)
+  assert np.allclose(block['gd'], [0.0, 0.0, 1.0])
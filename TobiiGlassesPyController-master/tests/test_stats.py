@@ -0,0 +1,58 @@
+import math
+import random
+import statistics
+
+from tobiiglassesctrl.stats import OnlineStatistics, DecayedStats
+
+
+def test_window_statistics():
+  rng = random.Random(0)
+  online = OnlineStatistics(window=100, bins=1000)
+  values = [rng.uniform(2.0, 6.0) for i in range(1000)]
+  for i, pd in enumerate(values):
+    online.push({'ts': i * 10000, 's': 0, 'eye': 'left', 'pd': pd})
+    online.push({'ts': i * 10000, 's': 0, 'gp': [0.5 + (i % 10) / 100.0, 0.5]})
+  online.push({'ts': 10000000, 's': 1, 'eye': 'left', 'pd': 100.0})
+  last = values[-100:]
+  stats = online.get_stats('pd', 'left')[0]['window']
+  assert stats['n'] == 100
+  assert abs(stats['mean'] - statistics.mean(last)) < 1e-9
+  assert abs(stats['var'] - statistics.pvariance(last)) < 1e-9
+  assert stats['min'] == min(last) and stats['max'] == max(last)
+  assert abs(stats['p50'] - statistics.median(last)) < 0.1
+  assert abs(online.get_dispersion() - 0.09) < 1e-9
+
+
+def weighted_stats(samples, half_life):
+  ts_last = samples[-1][1]
+  weights = [0.5 ** ((ts_last - ts) / (half_life * 1e6)) for x, ts in samples]
+  total = sum(weights)
+  mean = sum(w * x for w, (x, ts) in zip(weights, samples)) / total
+  var = sum(w * (x - mean) ** 2 for w, (x, ts) in zip(weights, samples)) / total
+  acc = 0.0
+  for w, (x, ts) in sorted(zip(weights, samples), key=lambda item: item[1][0]):
+    acc += w
+    if acc >= total / 2:
+      return total, mean, var, x
+
+
+def test_decayed_statistics():
+  rng = random.Random(0)
+  half_life = 0.01
+  decayed = DecayedStats(half_life, 0.0, 10.0, bins=1000)
+  samples = []
+  # 500 half-lives: the lazy rescale of the sketch runs during the stream
+  for i in range(5000):
+    samples.append((rng.uniform(2.0, 6.0) + (2.0 if i > 4000 else 0.0), i * 1000))
+  # and a gap long enough to decay everything before it
+  for i in range(50):
+    samples.append((rng.gauss(4.0, 0.5), 100000000 + i * 1000))
+  for n, (x, ts) in enumerate(samples):
+    decayed.add(x, ts)
+    if n in (4500, len(samples) - 1):
+      weight, mean, var, median = weighted_stats(samples[:n + 1], half_life)
+      stats = decayed.get_stats()
+      assert math.isclose(stats['weight'], weight, rel_tol=1e-9)
+      assert math.isclose(stats['mean'], mean, rel_tol=1e-9)
+      assert math.isclose(stats['var'], var, rel_tol=1e-9)
+      assert abs(stats['p50'] - median) < 0.05
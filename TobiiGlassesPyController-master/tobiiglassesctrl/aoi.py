@@ -0,0 +1,159 @@
+# aoi.py: Areas of interest hit-testing and dwell statistics
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import numpy as np
+
+from .packets import GazeBuffer
+
+NO_AOI = -1
+
+
+class AOIIndex(object):
+	"""Uniform grid index of rectangular AOIs in normalized scene coordinates.
+
+	Rectangles are (x0, y0, x1, y1) with x0 < x1 and y0 < y1; where AOIs
+	overlap the one added first wins. The index is immutable: build a new one
+	to change the AOIs, it can be shared by the trackers of several devices.
+	"""
+
+	def __init__(self, rects, ids=None, grid=64, bounds=(0.0, 0.0, 1.0, 1.0)):
+		self.rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+		n = len(self.rects)
+		self.ids = list(range(n)) if ids is None else list(ids)
+		self.grid = grid
+		self.x0, self.y0, x1, y1 = bounds
+		self.cw = (x1 - self.x0) / grid
+		self.ch = (y1 - self.y0) / grid
+		# Candidate AOIs of every cell, padded with NO_AOI to the longest list
+		c0 = self.__cells__(self.rects[:, 0], self.rects[:, 1])
+		c1 = self.__cells__(self.rects[:, 2], self.rects[:, 3])
+		cells = [[] for i in range(grid * grid)]
+		for i in range(n):
+			for cy in range(c0[1][i], c1[1][i] + 1):
+				for cx in range(c0[0][i], c1[0][i] + 1):
+					cells[cy * grid + cx].append(i)
+		k = max([len(c) for c in cells] + [1])
+		self.table = np.full((grid * grid, k), NO_AOI, dtype=np.int32)
+		for cell, items in enumerate(cells):
+			self.table[cell, :len(items)] = items
+		# Sentinel rectangle for the padding, contains no point
+		self.padded = np.vstack([self.rects, [[np.inf, np.inf, -np.inf, -np.inf]]])
+
+	def __len__(self):
+		return len(self.rects)
+
+	def __cells__(self, x, y):
+		cx = np.clip(((x - self.x0) / self.cw).astype(np.int64), 0, self.grid - 1)
+		cy = np.clip(((y - self.y0) / self.ch).astype(np.int64), 0, self.grid - 1)
+		return cx, cy
+
+	def hit_test(self, xy):
+		"""Returns the index of the AOI containing each (x, y) point, or NO_AOI."""
+		xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+		x, y = xy[:, 0], xy[:, 1]
+		cx, cy = self.__cells__(np.nan_to_num(x, nan=-1.0), np.nan_to_num(y, nan=-1.0))
+		candidates = self.table[cy * self.grid + cx]
+		r = self.padded[candidates]
+		inside = ((r[..., 0] <= x[:, None]) & (x[:, None] < r[..., 2]) &
+				  (r[..., 1] <= y[:, None]) & (y[:, None] < r[..., 3]))
+		first = inside.argmax(axis=1)
+		hits = candidates[np.arange(len(xy)), first]
+		hits[~inside.any(axis=1)] = NO_AOI
+		return hits
+
+
+class AOITracker(GazeBuffer):
+	"""Incremental dwell time, entry counts and transitions over the AOIs of an index.
+
+	push() can be registered with TobiiGlassesController.add_data_listener
+	(valid gp samples are buffered) and update() resolves the buffered
+	samples as a batch; update_batch() takes arrays directly, e.g. the
+	blocks of a GazeResampler. The time between two samples is credited to
+	the AOI of the first one, up to max_gap microseconds. With a head
+	motion estimator (see imu.HeadMotionEstimator) the gaze points are
+	compensated for the head rotation before the hit-testing, for AOIs fixed
+	in the world rather than in the scene camera image.
+	"""
+
+	def __init__(self, index, max_gap=100000, head=None):
+		GazeBuffer.__init__(self)
+		self.index = index
+		self.max_gap = max_gap
+		self.head = head
+		n = len(index)
+		self.dwell = np.zeros(n, dtype=np.int64)
+		self.entries = np.zeros(n, dtype=np.int64)
+		self.transitions = {}
+		self.last_ts = None
+		self.last_hit = NO_AOI
+		self.last_visit = NO_AOI
+
+	def update(self):
+		pending = self.pop_pending()
+		if not pending:
+			return np.zeros(0, dtype=np.int32)
+		samples = np.array(pending, dtype=np.float64)
+		return self.update_batch(samples[:, 0].astype(np.int64), samples[:, 1:])
+
+	def update_batch(self, ts, xy, valid=None):
+		"""Resolves a batch of samples ordered by ts and accumulates the statistics.
+
+		Returns the AOI index of every sample (NO_AOI for invalid samples).
+		"""
+		ts = np.asarray(ts, dtype=np.int64)
+		if self.head is not None:
+			xy = self.head.compensate(ts, xy)
+		hits = self.index.hit_test(xy)
+		if valid is not None:
+			hits[~np.asarray(valid, dtype=bool)] = NO_AOI
+		if len(ts) == 0:
+			return hits
+		n = len(self.index)
+		prev_ts = np.concatenate(([ts[0] if self.last_ts is None else self.last_ts], ts[:-1]))
+		prev_hits = np.concatenate(([self.last_hit], hits[:-1]))
+		dt = np.minimum(ts - prev_ts, self.max_gap)
+		held = (prev_hits != NO_AOI) & (dt > 0)
+		self.dwell += np.bincount(prev_hits[held], weights=dt[held], minlength=n).astype(np.int64)
+		entered = (hits != NO_AOI) & (hits != prev_hits)
+		self.entries += np.bincount(hits[entered], minlength=n)
+		visits = np.concatenate(([self.last_visit], hits[hits != NO_AOI]))
+		change = (visits[1:] != visits[:-1]) & (visits[:-1] != NO_AOI)
+		if change.any():
+			codes = visits[:-1][change].astype(np.int64) * n + visits[1:][change]
+			codes, counts = np.unique(codes, return_counts=True)
+			for code, count in zip(codes.tolist(), counts.tolist()):
+				key = divmod(code, n)
+				self.transitions[key] = self.transitions.get(key, 0) + count
+		self.last_ts = ts[-1]
+		self.last_hit = hits[-1]
+		if len(visits) > 1:
+			self.last_visit = visits[-1]
+		return hits
+
+	def get_stats(self):
+		"""Returns {aoi id: {'dwell': microseconds, 'entries': count}} of the visited AOIs."""
+		ids = self.index.ids
+		return dict((ids[i], {'dwell': int(self.dwell[i]), 'entries': int(self.entries[i])})
+					for i in np.nonzero(self.entries)[0])
+
+	def get_transition_matrix(self):
+		"""Dense matrix of the transitions between AOI indices (n x n)."""
+		n = len(self.index)
+		matrix = np.zeros((n, n), dtype=np.int64)
+		for (a, b), count in self.transitions.items():
+			matrix[a, b] = count
+		return matrix
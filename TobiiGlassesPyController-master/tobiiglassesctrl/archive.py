@@ -0,0 +1,309 @@
+# archive.py: Compressed, seekable archive of the live data stream
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import zlib
+import struct
+import logging
+
+import numpy as np
+
+from .packets import RECORD, PACKET_KEYS, PACKET_WIDTH, encode_packet
+from .ingest import RECORD_DTYPE, decode_records
+
+logger = logging.getLogger(__name__)
+
+# File layout: FILE_HEADER, blocks (BLOCK_HEADER + compressed payload), the
+# block index (INDEX_ENTRY per block) and the FOOTER pointing at the index.
+FILE_MAGIC = b'TGA1'
+INDEX_MAGIC = b'TGAI'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sH')
+BLOCK_HEADER = struct.Struct('<BII')
+INDEX_ENTRY = struct.Struct('<QIIqq')
+FOOTER = struct.Struct('<QI4s')
+# Payload: COUNTS, one GROUP_HEADER per (channel, eye), the group of every
+# record (uint8) and the columns of each group.
+COUNTS = struct.Struct('<IB')
+GROUP_HEADER = struct.Struct('<BBIdd')
+FIRST = struct.Struct('<q')
+
+CODECS = {'zlib': 1, 'lzma': 2}
+DEFAULT_BLOCK_RECORDS = 65536
+
+# Resolution of the values in the JSON sent by the device
+QUANTUM = {'ac': 1e-3, 'gy': 1e-3, 'pc': 1e-2, 'pd': 1e-2, 'gd': 1e-4, 'gp': 1e-4, 'gp3': 1e-2,
+		   'pts': 1.0, 'vts': 1.0, 'l': 1.0}
+
+_INT_TYPES = ((1, np.int8), (2, np.int16), (4, np.int32), (8, np.int64))
+
+
+def _compress(data, codec, level):
+	if codec == CODECS['lzma']:
+		import lzma
+		return lzma.compress(data, preset=6 if level is None else level)
+	return zlib.compress(data, 6 if level is None else level)
+
+def _decompress(data, codec):
+	if codec == CODECS['lzma']:
+		import lzma
+		return lzma.decompress(data)
+	return zlib.decompress(data)
+
+def _pack_ints(values):
+	"""Width byte followed by the values in the narrowest signed integer type."""
+	lo = int(values.min()) if len(values) else 0
+	hi = int(values.max()) if len(values) else 0
+	for width, dtype in _INT_TYPES:
+		info = np.iinfo(dtype)
+		if info.min <= lo and hi <= info.max:
+			return struct.pack('<B', width) + values.astype(dtype).tobytes()
+
+def _unpack_ints(buf, pos, count):
+	width = buf[pos]
+	dtype = dict(_INT_TYPES)[width]
+	values = np.frombuffer(buf, dtype=dtype, count=count, offset=pos + 1).astype(np.int64)
+	return values, pos + 1 + width * count
+
+def _pack_delta(values):
+	values = np.asarray(values, dtype=np.int64)
+	return FIRST.pack(int(values[0])) + _pack_ints(np.diff(values))
+
+def _unpack_delta(buf, pos, count):
+	first = FIRST.unpack_from(buf, pos)[0]
+	deltas, pos = _unpack_ints(buf, pos + FIRST.size, count - 1)
+	return np.concatenate(([first], first + np.cumsum(deltas))), pos
+
+def _pack_floats(values, quantum):
+	nan = np.isnan(values)
+	q = np.round(np.where(nan, 0.0, values) / quantum).astype(np.int64)
+	if nan.any():
+		return b'\x01' + np.packbits(nan).tobytes() + _pack_delta(q)
+	return b'\x00' + _pack_delta(q)
+
+def _unpack_floats(buf, pos, count, quantum):
+	nan = None
+	if buf[pos]:
+		nbytes = (count + 7) // 8
+		nan = np.unpackbits(np.frombuffer(buf, dtype=np.uint8, count=nbytes, offset=pos + 1))[:count].astype(bool)
+		pos += nbytes
+	q, pos = _unpack_delta(buf, pos + 1, count)
+	values = q * quantum
+	if nan is not None:
+		values[nan] = np.nan
+	return values, pos
+
+def _width(ch):
+	key = PACKET_KEYS[ch - 1] if 0 < ch <= len(PACKET_KEYS) else None
+	if key is None:
+		return 3
+	# pts packets carry pv in v[0]
+	return max(PACKET_WIDTH[key], 1 if key == 'pts' else 0)
+
+def encode_block(records, codec='zlib', level=None, quanta=None):
+	"""Encodes a record array into an independently decodable block."""
+	quanta = dict(QUANTUM, **(quanta or {}))
+	codec_id = CODECS[codec]
+	keys = records['ch'].astype(np.int64) * 3 + records['eye']
+	groups, group_of = np.unique(keys, return_inverse=True)
+	order = np.argsort(group_of, kind='stable')
+	bounds = np.concatenate(([0], np.cumsum(np.bincount(group_of, minlength=len(groups)))))
+	headers, columns = [], []
+	for g, key in enumerate(groups.tolist()):
+		ch, eye = divmod(key, 3)
+		name = PACKET_KEYS[ch - 1] if 0 < ch <= len(PACKET_KEYS) else None
+		quantum = quanta.get(name, 1e-6)
+		rec = records[order[bounds[g]:bounds[g + 1]]]
+		headers.append(GROUP_HEADER.pack(ch, eye, len(rec), quantum, quanta['l']))
+		columns += [_pack_delta(rec['ts']), _pack_delta(rec['gidx']), _pack_delta(rec['iv']), _pack_ints(rec['s'])]
+		columns += [_pack_floats(rec['v'][:, i], quantum) for i in range(_width(ch))]
+		columns.append(_pack_floats(rec['l'], quanta['l']))
+	raw = b''.join([COUNTS.pack(len(records), len(groups))] + headers +
+				   [group_of.astype(np.uint8).tobytes()] + columns)
+	payload = _compress(raw, codec_id, level)
+	return BLOCK_HEADER.pack(codec_id, len(raw), len(payload)) + payload
+
+def decode_block(block):
+	"""Decodes a block of encode_block() back into a record array."""
+	codec_id, raw_size, size = BLOCK_HEADER.unpack_from(block)
+	buf = _decompress(block[BLOCK_HEADER.size:BLOCK_HEADER.size + size], codec_id)
+	n, ngroups = COUNTS.unpack_from(buf)
+	pos = COUNTS.size
+	headers = []
+	for g in range(ngroups):
+		headers.append(GROUP_HEADER.unpack_from(buf, pos))
+		pos += GROUP_HEADER.size
+	group_of = np.frombuffer(buf, dtype=np.uint8, count=n, offset=pos)
+	pos += n
+	order = np.argsort(group_of, kind='stable')
+	out = np.zeros(n, dtype=RECORD_DTYPE)
+	out['v'] = np.nan
+	start = 0
+	for ch, eye, count, quantum, l_quantum in headers:
+		idx = order[start:start + count]
+		start += count
+		out['ch'][idx] = ch
+		out['eye'][idx] = eye
+		for name in ('ts', 'gidx', 'iv'):
+			out[name][idx], pos = _unpack_delta(buf, pos, count)
+		out['s'][idx], pos = _unpack_ints(buf, pos, count)
+		for i in range(_width(ch)):
+			out['v'][idx, i], pos = _unpack_floats(buf, pos, count, quantum)
+		out['l'][idx], pos = _unpack_floats(buf, pos, count, l_quantum)
+	return out
+
+
+class ArchiveWriter(object):
+	"""Writes packets or records into a block-compressed archive.
+
+	ts, gidx and the pts/vts values are delta encoded per (channel, eye),
+	the float values are quantized to the resolution of the device (QUANTUM,
+	overridable with quanta) and delta encoded, then every block_records
+	records are compressed with zlib or lzma into a block that can be decoded
+	alone. The index of the blocks with their ts range is written by close().
+	"""
+
+	def __init__(self, path, codec='zlib', level=None, block_records=DEFAULT_BLOCK_RECORDS, quanta=None):
+		if codec not in CODECS:
+			raise ValueError("Unknown archive codec %s" % codec)
+		self.codec = codec
+		self.level = level
+		self.block_records = block_records
+		self.quanta = quanta
+		self.index = []
+		self.packets = []
+		self.pending = []
+		self.npending = 0
+		self.f = open(path, 'wb')
+		self.f.write(FILE_HEADER.pack(FILE_MAGIC, VERSION))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def push(self, packet):
+		values = encode_packet(packet)
+		if values is None:
+			return
+		self.packets.append(RECORD.pack(*values))
+		self.npending += 1
+		if self.npending >= self.block_records:
+			self.flush()
+
+	def push_records(self, records):
+		self.__collect_packets__()
+		self.pending.append(records)
+		self.npending += len(records)
+		if self.npending >= self.block_records:
+			self.flush()
+
+	def __collect_packets__(self):
+		if self.packets:
+			self.pending.append(np.frombuffer(b''.join(self.packets), dtype=RECORD_DTYPE))
+			self.packets = []
+
+	def flush(self):
+		self.__collect_packets__()
+		if not self.pending:
+			return
+		records = np.concatenate(self.pending)
+		self.pending = []
+		self.npending = 0
+		for start in range(0, len(records), self.block_records):
+			chunk = records[start:start + self.block_records]
+			block = encode_block(chunk, self.codec, self.level, self.quanta)
+			self.index.append((self.f.tell(), len(block), len(chunk), int(chunk['ts'].min()), int(chunk['ts'].max())))
+			self.f.write(block)
+
+	def close(self):
+		if self.f.closed:
+			return
+		self.flush()
+		offset = self.f.tell()
+		for entry in self.index:
+			self.f.write(INDEX_ENTRY.pack(*entry))
+		self.f.write(FOOTER.pack(offset, len(self.index), INDEX_MAGIC))
+		self.f.close()
+		logger.debug("Archive written: %d blocks", len(self.index))
+
+
+class ArchiveReader(object):
+	"""Reads an archive of ArchiveWriter, decoding only the blocks of the requested ts range."""
+
+	def __init__(self, path):
+		self.f = open(path, 'rb')
+		magic, version = FILE_HEADER.unpack(self.f.read(FILE_HEADER.size))
+		if magic != FILE_MAGIC or version > VERSION:
+			self.f.close()
+			raise ValueError("%s is not a supported archive" % path)
+		self.f.seek(-FOOTER.size, 2)
+		offset, count, magic = FOOTER.unpack(self.f.read(FOOTER.size))
+		if magic != INDEX_MAGIC:
+			self.f.close()
+			raise ValueError("%s has no block index (the writer was not closed)" % path)
+		self.f.seek(offset)
+		data = self.f.read(INDEX_ENTRY.size * count)
+		self.index = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(count)]
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		self.f.close()
+
+	def __len__(self):
+		return sum(entry[2] for entry in self.index)
+
+	def get_ts_range(self):
+		if not self.index:
+			return None
+		return min(e[3] for e in self.index), max(e[4] for e in self.index)
+
+	def iter_blocks(self, start_ts=None, end_ts=None):
+		for offset, size, count, ts_min, ts_max in self.index:
+			if (start_ts is None or ts_max >= start_ts) and (end_ts is None or ts_min <= end_ts):
+				self.f.seek(offset)
+				yield decode_block(self.f.read(size))
+
+	def iter_records(self, start_ts=None, end_ts=None, keys=None):
+		"""Yields the records with start_ts <= ts <= end_ts, block by block."""
+		channels = None if keys is None else [PACKET_KEYS.index(key) + 1 for key in keys]
+		for records in self.iter_blocks(start_ts, end_ts):
+			mask = np.ones(len(records), dtype=bool)
+			if start_ts is not None:
+				mask &= records['ts'] >= start_ts
+			if end_ts is not None:
+				mask &= records['ts'] <= end_ts
+			if channels is not None:
+				mask &= np.isin(records['ch'], channels)
+			if mask.any():
+				yield records[mask]
+
+	def read(self, start_ts=None, end_ts=None, keys=None):
+		chunks = list(self.iter_records(start_ts, end_ts, keys))
+		if not chunks:
+			return np.zeros(0, dtype=RECORD_DTYPE)
+		return np.concatenate(chunks)
+
+	def iter_packets(self, start_ts=None, end_ts=None, keys=None):
+		for records in self.iter_records(start_ts, end_ts, keys):
+			for packet in decode_records(records):
+				yield packet
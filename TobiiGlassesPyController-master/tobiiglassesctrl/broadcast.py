@@ -0,0 +1,330 @@
+# broadcast.py: Local rebroadcast of the live data stream to several consumers
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import socket
+import struct
+import logging
+import selectors
+import threading
+from collections import deque
+
+from .packets import RECORD, RECORD_SIZE, empty_data, encode_packet, decode_record, refresh_data, notify_listeners
+
+logger = logging.getLogger(__name__)
+
+# Sent by the server on connection: magic and size of the records that follow
+HEADER = struct.Struct('<4sI')
+MAGIC = b'TGRB'
+DEFAULT_MAX_QUEUE = 4096
+SEND_SIZE = 64 * 1024
+
+
+def _socket_family(address):
+	return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+class _Client(object):
+
+	def __init__(self, sock, peer):
+		self.sock = sock
+		self.fd = sock.fileno()
+		self.peer = peer
+		self.queue = deque()
+		self.out = b''
+		self.dropped = 0
+		self.writing = False
+
+
+class BroadcastServer(object):
+	"""Republishes the packets of one controller to local clients.
+
+	address is a (host, port) tuple for TCP (port 0 picks a free port, see
+	self.address once started) or a path for a Unix socket. Every packet is
+	sent as one packets.RECORD (64 bytes) after a HEADER, so the stream is
+	framed by the record size. push() never blocks the streaming thread: a
+	client that does not keep up has up to max_queue records queued, then
+	its oldest records are dropped (and counted in get_stats()).
+
+	With a controller the server registers push() as its data listener on
+	start(); without one, push() can be fed with any stream of packets, e.g.
+	a recording replayed with recording.RecordingReader.iter_packets().
+	"""
+
+	def __init__(self, controller=None, address=('127.0.0.1', 0), max_queue=DEFAULT_MAX_QUEUE):
+		self.controller = controller
+		self.address = address
+		self.max_queue = max_queue
+		self.clients = {}
+		self.running = False
+		self.sock = None
+		self.thread = None
+		self.lock = threading.Lock()
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *args):
+		self.stop()
+
+	def start(self):
+		family = _socket_family(self.address)
+		if family == socket.AF_UNIX and os.path.exists(self.address):
+			os.unlink(self.address)
+		self.sock = socket.socket(family, socket.SOCK_STREAM)
+		if family == socket.AF_INET:
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.sock.bind(self.address)
+		self.sock.listen(16)
+		self.sock.setblocking(False)
+		self.address = self.sock.getsockname()
+		self.wakeup_r, self.wakeup_w = socket.socketpair()
+		self.wakeup_r.setblocking(False)
+		self.wakeup_w.setblocking(False)
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(self.sock, selectors.EVENT_READ)
+		self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+		self.running = True
+		self.thread = threading.Thread(target=self.__serve__)
+		self.thread.daemon = True
+		self.thread.start()
+		if self.controller is not None:
+			self.controller.add_data_listener(self.push)
+		logger.debug("Rebroadcasting on %s", self.address)
+
+	def stop(self):
+		if not self.running:
+			return
+		if self.controller is not None:
+			self.controller.remove_data_listener(self.push)
+		self.running = False
+		self.__wakeup__()
+		self.thread.join()
+		for client in list(self.clients.values()):
+			self.__drop_client__(client)
+		self.selector.close()
+		self.sock.close()
+		self.wakeup_r.close()
+		self.wakeup_w.close()
+		if _socket_family(self.address) == socket.AF_UNIX:
+			try:
+				os.unlink(self.address)
+			except OSError:
+				pass
+
+	def push(self, packet):
+		values = encode_packet(packet)
+		if values is None:
+			return
+		frame = RECORD.pack(*values)
+		wake = False
+		with self.lock:
+			for client in self.clients.values():
+				if not client.queue:
+					wake = True
+				client.queue.append(frame)
+				if len(client.queue) > self.max_queue:
+					client.queue.popleft()
+					client.dropped += 1
+		if wake:
+			self.__wakeup__()
+
+	def get_stats(self):
+		"""Returns {client address: {'queued': records, 'dropped': records}}."""
+		with self.lock:
+			return dict((str(c.peer), {'queued': len(c.queue), 'dropped': c.dropped}) for c in self.clients.values())
+
+	def __wakeup__(self):
+		try:
+			self.wakeup_w.send(b'\0')
+		except (BlockingIOError, OSError):
+			pass
+
+	def __serve__(self):
+		while self.running:
+			for key, events in self.selector.select(timeout=1.0):
+				if key.fileobj is self.sock:
+					self.__accept__()
+				elif key.fileobj is self.wakeup_r:
+					try:
+						while self.wakeup_r.recv(4096):
+							pass
+					except BlockingIOError:
+						pass
+				else:
+					client = key.data
+					if events & selectors.EVENT_READ:
+						self.__read__(client)
+					if events & selectors.EVENT_WRITE and client.fd in self.clients:
+						self.__flush__(client)
+			for client in list(self.clients.values()):
+				if not client.writing and (client.out or client.queue):
+					self.__flush__(client)
+
+	def __accept__(self):
+		try:
+			sock, peer = self.sock.accept()
+		except BlockingIOError:
+			return
+		sock.setblocking(False)
+		client = _Client(sock, peer or sock.fileno())
+		client.out = HEADER.pack(MAGIC, RECORD_SIZE)
+		with self.lock:
+			self.clients[client.fd] = client
+		self.selector.register(sock, selectors.EVENT_READ, client)
+		logger.debug("Rebroadcast client %s connected", client.peer)
+
+	def __read__(self, client):
+		try:
+			data = client.sock.recv(4096)
+		except BlockingIOError:
+			return
+		except OSError:
+			data = b''
+		if not data:
+			self.__drop_client__(client)
+
+	def __flush__(self, client):
+		while True:
+			if not client.out:
+				with self.lock:
+					n = min(len(client.queue), SEND_SIZE // RECORD_SIZE)
+					if n == 0:
+						break
+					client.out = b''.join([client.queue.popleft() for i in range(n)])
+			try:
+				sent = client.sock.send(client.out)
+			except BlockingIOError:
+				sent = 0
+			except OSError:
+				self.__drop_client__(client)
+				return
+			client.out = client.out[sent:]
+			if client.out:
+				# The socket buffer is full: wait for it to drain
+				if not client.writing:
+					client.writing = True
+					self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+				return
+		if client.writing:
+			client.writing = False
+			self.selector.modify(client.sock, selectors.EVENT_READ, client)
+
+	def __drop_client__(self, client):
+		with self.lock:
+			self.clients.pop(client.fd, None)
+		try:
+			self.selector.unregister(client.sock)
+		except (KeyError, ValueError):
+			pass
+		client.sock.close()
+		logger.debug("Rebroadcast client %s disconnected", client.peer)
+
+
+class BroadcastClient(object):
+	"""Receives the packets of a BroadcastServer, with the get_data() and data
+	listener interface of TobiiGlassesController."""
+
+	def __init__(self, address, connect=True, timeout=5.0):
+		self.address = address
+		self.timeout = timeout
+		self.data = empty_data()
+		self.listeners = []
+		self.sock = None
+		self.thread = None
+		self.receiving = False
+		if connect:
+			self.connect()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def connect(self):
+		self.sock = socket.socket(_socket_family(self.address), socket.SOCK_STREAM)
+		try:
+			self.sock.settimeout(self.timeout)
+			self.sock.connect(self.address)
+			header = self.__recv_exactly__(HEADER.size)
+			magic, record_size = HEADER.unpack(header)
+			if magic != MAGIC or record_size != RECORD_SIZE:
+				raise ValueError("Unexpected rebroadcast stream from %s" % str(self.address))
+			self.sock.settimeout(None)
+		except Exception:
+			self.sock.close()
+			self.sock = None
+			raise
+		self.receiving = True
+		self.thread = threading.Thread(target=self.__receive__)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def close(self):
+		if self.sock is None:
+			return
+		self.receiving = False
+		try:
+			self.sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		self.sock.close()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		self.sock = None
+
+	def is_connected(self):
+		return self.receiving
+
+	def __recv_exactly__(self, n):
+		buf = b''
+		while len(buf) < n:
+			chunk = self.sock.recv(n - len(buf))
+			if not chunk:
+				raise ConnectionError("Rebroadcast server closed the connection")
+			buf += chunk
+		return buf
+
+	def __receive__(self):
+		buf = b''
+		while self.receiving:
+			try:
+				chunk = self.sock.recv(SEND_SIZE)
+			except OSError:
+				break
+			if not chunk:
+				break
+			buf += chunk
+			end = len(buf) - len(buf) % RECORD_SIZE
+			for values in RECORD.iter_unpack(buf[:end]):
+				packet = decode_record(values)
+				refresh_data(self.data, packet)
+				notify_listeners(self.listeners, packet)
+			buf = buf[end:]
+		self.receiving = False
+
+	def add_data_listener(self, listener):
+		self.listeners.append(listener)
+
+	def remove_data_listener(self, listener):
+		self.listeners.remove(listener)
+
+	def get_data(self):
+		return self.data
@@ -0,0 +1,258 @@
+# catalog.py: SQLite catalog of the recorded sessions
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+
+from .packets import PACKET_KEYS
+
+logger = logging.getLogger(__name__)
+
+ET_FREQUENCIES = (50, 100)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+	id INTEGER PRIMARY KEY,
+	path TEXT UNIQUE NOT NULL,
+	signature TEXT,
+	rec_id TEXT, rec_name TEXT, created TEXT,
+	project_id TEXT, project_name TEXT,
+	participant_id TEXT, participant_name TEXT,
+	calibration_id TEXT, calibration_state TEXT,
+	et_freq INTEGER,
+	start_ts INTEGER, end_ts INTEGER, duration REAL,
+	samples INTEGER, gp_samples INTEGER, gp_valid INTEGER, loss_rate REAL,
+	indexed REAL);
+CREATE INDEX IF NOT EXISTS sessions_participant ON sessions (participant_name, participant_id);
+CREATE INDEX IF NOT EXISTS sessions_project ON sessions (project_name, project_id);
+CREATE INDEX IF NOT EXISTS sessions_freq_loss ON sessions (et_freq, loss_rate);
+CREATE TABLE IF NOT EXISTS channels (
+	session_id INTEGER REFERENCES sessions (id) ON DELETE CASCADE,
+	channel TEXT, samples INTEGER, valid INTEGER,
+	PRIMARY KEY (session_id, channel));
+CREATE TABLE IF NOT EXISTS files (
+	session_id INTEGER REFERENCES sessions (id) ON DELETE CASCADE,
+	kind TEXT, path TEXT);
+CREATE INDEX IF NOT EXISTS files_session ON files (session_id);
+"""
+
+SESSION_COLUMNS = ('rec_id', 'rec_name', 'created', 'project_id', 'project_name', 'participant_id',
+				   'participant_name', 'calibration_id', 'calibration_state', 'et_freq', 'start_ts',
+				   'end_ts', 'duration', 'samples', 'gp_samples', 'gp_valid', 'loss_rate')
+
+
+def _load_json(path):
+	try:
+		with open(path) as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return {}
+
+def _name(obj, info_key):
+	info = obj.get(info_key)
+	return info.get('Name') if isinstance(info, dict) else None
+
+def is_recording_dir(path):
+	return os.path.isdir(os.path.join(path, 'segments')) or os.path.isfile(os.path.join(path, 'recording.json'))
+
+def recording_metadata(path):
+	"""Session metadata from the JSON files of an SD card recording directory.
+
+	The participant, project and calibration files are looked up in the
+	recording directory and in the projects/<pr>/{participants,calibrations}
+	layout of the SD card; missing values are None.
+	"""
+	recording = _load_json(os.path.join(path, 'recording.json'))
+	project_dir = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+	pa_id = recording.get('rec_participant')
+	participant = _load_json(os.path.join(path, 'participant.json')) or \
+		_load_json(os.path.join(project_dir, 'participants', str(pa_id), 'participant.json'))
+	project = _load_json(os.path.join(path, 'project.json')) or _load_json(os.path.join(project_dir, 'project.json'))
+	ca_id = recording.get('rec_calibration')
+	calibration = _load_json(os.path.join(path, 'calibration.json')) or \
+		_load_json(os.path.join(project_dir, 'calibrations', str(ca_id), 'calibration.json'))
+	sysinfo = _load_json(os.path.join(path, 'sysinfo.json'))
+	return {'rec_id': recording.get('rec_id', os.path.basename(os.path.abspath(path))),
+			'rec_name': _name(recording, 'rec_info'),
+			'created': recording.get('rec_created'),
+			'project_id': project.get('pr_id', participant.get('pa_project')),
+			'project_name': _name(project, 'pr_info'),
+			'participant_id': participant.get('pa_id', pa_id),
+			'participant_name': _name(participant, 'pa_info'),
+			'calibration_id': calibration.get('ca_id', ca_id),
+			'calibration_state': calibration.get('ca_state'),
+			'et_freq': sysinfo.get('sys_et_freq', recording.get('sys_et_freq'))}
+
+def recording_stats(path, workers=0):
+	"""Summary statistics of the livedata of a recording (requires numpy)."""
+	import numpy as np
+	from .recording import RecordingReader
+	counts = np.zeros(len(PACKET_KEYS) + 1, dtype=np.int64)
+	valid = np.zeros(len(PACKET_KEYS) + 1, dtype=np.int64)
+	start_ts = end_ts = None
+	with RecordingReader(path, workers=workers) as reader:
+		for records in reader.iter_records():
+			counts += np.bincount(records['ch'], minlength=len(counts))
+			valid += np.bincount(records['ch'][records['s'] == 0], minlength=len(counts))
+			lo, hi = int(records['ts'].min()), int(records['ts'].max())
+			start_ts = lo if start_ts is None else min(start_ts, lo)
+			end_ts = hi if end_ts is None else max(end_ts, hi)
+	gp = PACKET_KEYS.index('gp') + 1
+	stats = {'start_ts': start_ts, 'end_ts': end_ts,
+			 'duration': None if start_ts is None else (end_ts - start_ts) * 1e-6,
+			 'samples': int(counts.sum()), 'gp_samples': int(counts[gp]), 'gp_valid': int(valid[gp]),
+			 'loss_rate': 1.0 - float(valid[gp]) / counts[gp] if counts[gp] else None,
+			 'channels': dict((key, (int(counts[i + 1]), int(valid[i + 1])))
+							  for i, key in enumerate(PACKET_KEYS) if counts[i + 1])}
+	if stats['duration']:
+		# Nearest supported frequency, for recordings without sysinfo
+		rate = counts[gp] / stats['duration']
+		stats['estimated_et_freq'] = min(ET_FREQUENCIES, key=lambda f: abs(f - rate))
+	return stats
+
+
+class SessionCatalog(object):
+	"""SQLite catalog of recordings with their metadata and summary statistics.
+
+	scan() walks a tree of recordings (e.g. a copy of the SD card) and only
+	indexes the recordings whose files changed since the last scan, so it can
+	be run after every session. Queries run on indexed columns; the rows
+	carry the path of the recording and get_files() its data files.
+	"""
+
+	def __init__(self, path, workers=0):
+		self.path = path
+		self.workers = workers
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.row_factory = sqlite3.Row
+		self.db.execute('PRAGMA foreign_keys = ON')
+		self.db.executescript(SCHEMA)
+		self.lock = threading.Lock()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		self.db.close()
+
+	def __signature__(self, path, files):
+		parts = []
+		for filename in [os.path.join(path, 'recording.json')] + [f for kind, f in files]:
+			try:
+				st = os.stat(filename)
+				parts.append('%s:%d:%d' % (os.path.basename(filename), st.st_size, int(st.st_mtime * 1e6)))
+			except OSError:
+				pass
+		return '|'.join(parts)
+
+	def scan(self, root):
+		"""Indexes the new or changed recordings under root, returns how many were indexed."""
+		indexed = 0
+		for dirpath, dirnames, filenames in os.walk(root):
+			if is_recording_dir(dirpath):
+				dirnames[:] = []
+				if self.update(dirpath):
+					indexed += 1
+		return indexed
+
+	def update(self, path, force=False):
+		"""Indexes one recording directory, unless it did not change. Returns True if indexed."""
+		from .recording import recording_files
+		path = os.path.abspath(path)
+		files = recording_files(path)
+		signature = self.__signature__(path, files)
+		with self.lock:
+			row = self.db.execute('SELECT signature FROM sessions WHERE path = ?', (path,)).fetchone()
+		if row is not None and row['signature'] == signature and not force:
+			return False
+		session = recording_metadata(path)
+		stats = recording_stats(path, self.workers) if any(kind == 'livedata' for kind, f in files) else {}
+		session.update((k, v) for k, v in stats.items() if k in SESSION_COLUMNS)
+		if session['et_freq'] is None:
+			session['et_freq'] = stats.get('estimated_et_freq')
+		self.add_session(path, session, stats.get('channels', {}), files, signature)
+		logger.debug("Indexed session %s", path)
+		return True
+
+	def add_session(self, path, session, channels=None, files=None, signature=None):
+		"""Inserts or replaces a session, e.g. one created by the controller and exported locally."""
+		values = [session.get(c) for c in SESSION_COLUMNS]
+		with self.lock, self.db:
+			self.db.execute('DELETE FROM sessions WHERE path = ?', (path,))
+			cursor = self.db.execute('INSERT INTO sessions (path, signature, indexed, %s) VALUES (?, ?, ?, %s)'
+									 % (', '.join(SESSION_COLUMNS), ', '.join('?' * len(SESSION_COLUMNS))),
+									 [path, signature, time.time()] + values)
+			session_id = cursor.lastrowid
+			self.db.executemany('INSERT INTO channels VALUES (?, ?, ?, ?)',
+								[(session_id, key, n, valid) for key, (n, valid) in (channels or {}).items()])
+			self.db.executemany('INSERT INTO files VALUES (?, ?, ?)',
+								[(session_id, kind, f) for kind, f in (files or [])])
+		return session_id
+
+	def remove_missing(self):
+		"""Drops the sessions whose directory no longer exists, returns how many."""
+		with self.lock, self.db:
+			paths = [row['path'] for row in self.db.execute('SELECT path FROM sessions')]
+			missing = [(p,) for p in paths if not os.path.exists(p)]
+			self.db.executemany('DELETE FROM sessions WHERE path = ?', missing)
+		return len(missing)
+
+	def find(self, project=None, participant=None, et_freq=None, min_loss_rate=None, max_loss_rate=None,
+			 calibration_state=None, min_duration=None):
+		"""Sessions matching all the given filters (project and participant match names or ids)."""
+		clauses, params = [], []
+		if project is not None:
+			clauses.append('(project_name = ? OR project_id = ?)')
+			params += [project, project]
+		if participant is not None:
+			clauses.append('(participant_name = ? OR participant_id = ?)')
+			params += [participant, participant]
+		for column, op, value in (('et_freq', '=', et_freq), ('loss_rate', '>=', min_loss_rate),
+								  ('loss_rate', '<=', max_loss_rate), ('calibration_state', '=', calibration_state),
+								  ('duration', '>=', min_duration)):
+			if value is not None:
+				clauses.append('%s %s ?' % (column, op))
+				params.append(value)
+		sql = 'SELECT * FROM sessions'
+		if clauses:
+			sql += ' WHERE ' + ' AND '.join(clauses)
+		return self.query(sql + ' ORDER BY created, path', params)
+
+	def query(self, sql, params=()):
+		"""Runs any SELECT on the catalog, returns the rows as dictionaries."""
+		with self.lock:
+			return [dict(row) for row in self.db.execute(sql, params)]
+
+	def get_channels(self, path):
+		rows = self.query('SELECT c.channel, c.samples, c.valid FROM channels c JOIN sessions s ON s.id = c.session_id '
+						  'WHERE s.path = ?', (os.path.abspath(path),))
+		return dict((r['channel'], {'samples': r['samples'], 'valid': r['valid']}) for r in rows)
+
+	def get_files(self, path):
+		"""{kind: [paths]} of the data files of a session (livedata, video)."""
+		files = {}
+		for r in self.query('SELECT f.kind, f.path FROM files f JOIN sessions s ON s.id = f.session_id '
+							'WHERE s.path = ? ORDER BY f.rowid', (os.path.abspath(path),)):
+			files.setdefault(r['kind'], []).append(r['path'])
+		return files
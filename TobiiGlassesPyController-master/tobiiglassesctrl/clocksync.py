@@ -0,0 +1,153 @@
+# clocksync.py: Mapping between the device ts and the host monotonic clock
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import uuid
+import logging
+import threading
+from collections import deque
+
+from .metrics import clock
+
+logger = logging.getLogger(__name__)
+
+SYNC_EVENT_TYPE = 'clocksync'
+
+
+class ClockSync(object):
+	"""Estimates the offset and drift between the device ts (microseconds) and
+	the host clock (metrics.clock(), seconds).
+
+	Every packet gives host arrival time - ts = offset + network delay, with
+	a delay that is never negative: the minimum over windows of window
+	microseconds of device time follows offset + the smallest delay, and a
+	linear regression over the last max_windows minima gives the drift.
+	The smallest delay itself is measured by sync events (send_event()):
+	the device stamps them between the host send and receive times, so the
+	round trip with the lowest duration bounds the offset from both sides.
+
+	push() must be registered with TobiiGlassesController.add_data_listener
+	(see TobiiGlassesController.get_clock_sync()). With process_ingest the
+	listeners are notified in batches and the events are not forwarded,
+	so the estimate is much coarser.
+	"""
+
+	def __init__(self, window=1000000, max_windows=120, max_events=16):
+		self.window = window
+		self.minima = deque(maxlen=max_windows)
+		self.current = None
+		self.events = deque(maxlen=max_events)
+		self.pending = {}
+		self.d0 = None
+		self.slope = 0.0
+		self.intercept = None
+		self.latency = 0.0
+		self.lock = threading.Lock()
+
+	def push(self, packet, host_time=None):
+		host_time = clock() if host_time is None else host_time
+		ts = packet.get('ts')
+		if ts is None or packet.get('s', 0) != 0:
+			return
+		if packet.get('type') == SYNC_EVENT_TYPE:
+			self.observe_event(packet.get('tag'), ts, host_time)
+		else:
+			self.observe(ts, host_time)
+
+	def observe(self, ts, host_time):
+		"""Adds the arrival of a packet stamped ts by the device at host_time."""
+		offset = host_time * 1e6 - ts
+		with self.lock:
+			if self.current is None or ts >= self.current[0] + self.window:
+				if self.current is not None:
+					self.minima.append((self.current[1], self.current[2]))
+					self.__fit__()
+				self.current = [ts, ts, offset]
+			elif offset < self.current[2]:
+				self.current[1] = ts
+				self.current[2] = offset
+			if self.intercept is None:
+				self.d0 = ts
+				self.intercept = offset
+
+	def send_event(self, controller):
+		"""Posts a sync event whose round trip measures the minimum delay."""
+		tag = uuid.uuid4().hex
+		with self.lock:
+			self.pending[tag] = clock()
+		controller.send_custom_event(SYNC_EVENT_TYPE, tag)
+		return tag
+
+	def observe_event(self, tag, ts, host_time):
+		with self.lock:
+			sent = self.pending.pop(tag, None)
+			if sent is None:
+				return
+			self.events.append((host_time - sent, ts, (sent + host_time) * 0.5e6 - ts))
+			self.__fit__()
+
+	def __fit__(self):
+		points = list(self.minima)
+		if self.current is not None:
+			points.append((self.current[1], self.current[2]))
+		if not points:
+			return
+		self.d0 = points[0][0]
+		n = float(len(points))
+		mx = sum(p[0] - self.d0 for p in points) / n
+		my = sum(p[1] for p in points) / n
+		sxx = sum((p[0] - self.d0 - mx) ** 2 for p in points)
+		sxy = sum((p[0] - self.d0 - mx) * (p[1] - my) for p in points)
+		self.slope = sxy / sxx if sxx > 0 else 0.0
+		self.intercept = my - self.slope * mx
+		if self.events:
+			rtt, ts, offset = min(self.events)
+			self.latency = max(self.__envelope__(ts) - offset, 0.0)
+			logger.debug("Clock sync: drift %.3f ppm, latency %.1f us (rtt %.1f us)", self.slope * 1e6, self.latency, rtt * 1e6)
+
+	def __envelope__(self, ts):
+		return self.intercept + self.slope * (ts - self.d0)
+
+	def is_synced(self):
+		return self.intercept is not None
+
+	def get_offset(self, ts=None):
+		"""host clock (us) - device ts at the given device ts (default: the last window)."""
+		with self.lock:
+			if self.intercept is None:
+				return None
+			if ts is None:
+				ts = self.current[1]
+			return self.__envelope__(ts) - self.latency
+
+	def get_drift(self):
+		"""Drift of the host clock relative to the device clock (dimensionless)."""
+		return self.slope
+
+	def device_ts_to_host(self, ts):
+		"""Host time (seconds, metrics.clock() timebase) of a device ts."""
+		with self.lock:
+			if self.intercept is None:
+				raise ValueError("No packet received yet, the clock offset is unknown")
+			return (ts + self.__envelope__(ts) - self.latency) * 1e-6
+
+	def host_to_device_ts(self, host_time):
+		"""Device ts (microseconds) of a host time (seconds, metrics.clock() timebase)."""
+		with self.lock:
+			if self.intercept is None:
+				raise ValueError("No packet received yet, the clock offset is unknown")
+			# host_us = ts + intercept + slope * (ts - d0) - latency
+			return (host_time * 1e6 - self.intercept + self.slope * self.d0 + self.latency) / (1.0 + self.slope)
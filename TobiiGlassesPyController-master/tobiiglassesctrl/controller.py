@@ -22,54 +22,59 @@ import threading
 import socket
 import uuid
 import logging
-import struct
 import sys
-import select
 
-# python2 backwards compatibility for errors
-if sys.version_info[0] < 3:
-	class ConnectionError(BaseException):
-		pass
+from .packets import empty_data, refresh_data, notify_listeners
+from .metrics import clock, endpoint_name
 
-try:
-	import netifaces
-	TOBII_DISCOVERY_ALLOWED = True
-except:
-	TOBII_DISCOVERY_ALLOWED = False
-
-try:
-	from urllib.parse import urlparse, urlencode
-	from urllib.request import urlopen, Request
-	from urllib.error import URLError, HTTPError
-except ImportError:
-	from urlparse import urlparse
-	from urllib import urlencode
-	from urllib2 import urlopen, Request, HTTPError, URLError
+logger = logging.getLogger(__name__)
 
 socket.IPPROTO_IPV6 = 41
 TOBII_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S+%f'
 TOBII_DATETIME_FORMAT_HUMREAD = '%d/%m/%Y %H:%M:%S'
 
+# netifaces and urllib are imported on first use to keep the import of the package fast
+def _urllib():
+	from urllib.request import urlopen, Request
+	from urllib.error import URLError
+	return urlopen, Request, URLError
+
+def mksock(peer, iface_name=None):
+	iptype = socket.AF_INET
+	if ':' in peer[0]:
+		iptype = socket.AF_INET6
+	res = socket.getaddrinfo(peer[0], peer[1], socket.AF_UNSPEC, socket.SOCK_DGRAM, 0, socket.AI_PASSIVE)
+	family, socktype, proto, canonname, sockaddr = res[0]
+	sock = socket.socket(family, socktype, proto)
+	sock.settimeout(5.0)
+	try:
+		if iptype == socket.AF_INET6:
+			sock.setsockopt(socket.SOL_SOCKET, 25, iface_name+'\0')
+	except socket.error as e:
+		if e.errno == 1:
+			logger.warning("Binding to a network interface is permitted only for root users.")
+	return sock
+
 class TobiiGlassesController():
 
-	def __init__(self, address = None, video_scene = False, timeout = None):
+	def __init__(self, address = None, video_scene = False, timeout = None, process_ingest = False, connect = True):
 		self.timeout = 1
+		self.poll_interval = 1
 		self.streaming = False
 		self.video_scene = video_scene
+		self.process_ingest = process_ingest
+		self.ingest = None
+		self.listeners = []
+		self.metrics = None
+		self.registry = None
+		self.clock_sync = None
 		self.udpport = 49152
 		self.address = address
 		self.iface_name = None
-		logging.basicConfig(format='[%(levelname)s]: %(message)s', level=logging.DEBUG)
-
-		self.data = {}
-		nd = {'ts': -1}
-		self.data['mems'] = { 'ac': nd, 'gy': nd }
-		self.data['right_eye'] = { 'pc': nd, 'pd': nd, 'gd': nd}
-		self.data['left_eye'] = { 'pc': nd, 'pd': nd, 'gd': nd}
-		self.data['gp'] = nd
-		self.data['gp3'] = nd
-		self.data['pts'] = nd
-		self.data['vts'] = nd
+		self.data_socket = None
+		self.video_socket = None
+
+		self.data = empty_data()
 
 		self.project_id = str(uuid.uuid4())
 		self.project_name = "TobiiProGlasses PyController"
@@ -78,53 +83,59 @@ class TobiiGlassesController():
 		self.KA_DATA_MSG = "{\"type\": \"live.data.unicast\", \"key\": \""+ str(uuid.uuid4()) +"\", \"op\": \"start\"}"
 		self.KA_VIDEO_MSG = "{\"type\": \"live.video.unicast\",\"key\": \""+ str(uuid.uuid4()) +"_video\",  \"op\": \"start\"}"
 
-		if self.address is None:
-			data, address = self.__discover_device__()
-			if address is None:
-				raise ConnectionError("No device found using discovery process")
-			else:
-				try:
-					self.address = data["ipv4"]
-				except:
-					self.address = address
-		if "%" in self.address:
-			if sys.platform == "win32":
-				self.address,self.iface_name = self.address.split("%")
-			else:
-				self.iface_name = self.address.split("%")[1]
-		self.__set_URL__(self.udpport, self.address)
-		if self.__connect__(timeout = timeout) is False:
-			raise ConnectionError("Failed to connect to Tobii device")
+		if connect:
+			self.connect(timeout = timeout)
 
 	def __del__(self):
 		self.close()
 
 	def __connect__(self, timeout = None):
-		logging.debug("Connecting to the Tobii Pro Glasses 2 ...")
+		logger.debug("Connecting to the Tobii Pro Glasses 2 ...")
 		self.data_socket = self.__mksock__()
 		if self.video_scene:
 			self.video_socket = self.__mksock__()
 		res = self.wait_until_status_is_ok(timeout=timeout)
 		if res is True:
-			logging.debug("Tobii Pro Glasses 2 successful connected!")
+			logger.debug("Tobii Pro Glasses 2 successful connected!")
 		else:
-			logging.error("An error occurs trying to connect to the Tobii Pro Glasses")
+			logger.error("An error occurs trying to connect to the Tobii Pro Glasses")
 		return res
 
+	def __create_participant__(self, project_id, participant_name, participant_notes):
+		participant_id = self.get_participant_id(participant_name)
+
+		if participant_id is None:
+			data = {'pa_project': project_id,
+					'pa_info': { 'EagleId': str(uuid.uuid5(uuid.NAMESPACE_DNS, participant_name)),
+								 'Name': participant_name,
+								 'Notes': participant_notes},
+					'pa_created': self.__get_current_datetime__()}
+			json_data = self.__post_request__('/api/participants', data)
+			self.get_registry().add('participants', json_data)
+			logger.debug("Participant %s created! Project %s", json_data['pa_id'], project_id)
+			return json_data['pa_id']
+		else:
+			logger.debug("Participant %s already exists ...", participant_id)
+			return participant_id
+
 	def __disconnect__(self):
-		logging.debug("Disconnecting to the Tobii Pro Glasses 2")
+		logger.debug("Disconnecting to the Tobii Pro Glasses 2")
 		self.data_socket.close()
+		self.data_socket = None
 		if self.video_scene:
 			self.video_socket.close()
-		logging.debug("Tobii Pro Glasses 2 successful disconnected!")
+			self.video_socket = None
+		logger.debug("Tobii Pro Glasses 2 successful disconnected!")
 		return True
 
 	def __discover_device__(self):
-		if TOBII_DISCOVERY_ALLOWED == False:
-			logging.error("Device discovery is not available due to a missing dependency (netifaces)")
+		try:
+			import netifaces
+		except ImportError:
+			logger.error("Device discovery is not available due to a missing dependency (netifaces)")
 			exit(1)
 
-		logging.debug("Looking for a Tobii Pro Glasses 2 device ...")
+		logger.debug("Looking for a Tobii Pro Glasses 2 device ...")
 		MULTICAST_ADDR = 'ff02::1'
 		PORT = 13006
 
@@ -141,25 +152,49 @@ class TobiiGlassesController():
 					try:
 						discover_json = '{"type":"discover"}'
 						s6.sendto(discover_json.encode('utf-8'), (MULTICAST_ADDR, PORT_OUT))
-						logging.debug("Discover request sent to %s on interface %s " % ( str((MULTICAST_ADDR, PORT_OUT)),if_name) )
-						logging.debug("Waiting for a reponse from the device ...")
+						logger.debug("Discover request sent to %s on interface %s ", (MULTICAST_ADDR, PORT_OUT), if_name)
+						logger.debug("Waiting for a reponse from the device ...")
 						data, address = s6.recvfrom(1024)
 						jdata = json.loads(data.decode('utf-8'))
-						logging.debug("From: " + address[0] + " " + str(data))
-						logging.debug("Tobii Pro Glasses found with address: [%s]" % address[0])
+						logger.debug("From: %s %s", address[0], data)
+						logger.debug("Tobii Pro Glasses found with address: [%s]", address[0])
 						return (jdata, address[0])
 					except:
-						logging.debug("No device found on interface %s" % if_name)
+						logger.debug("No device found on interface %s", if_name)
 
-		logging.debug("The discovery process did not find any device!")
+		logger.debug("The discovery process did not find any device!")
 		return (None, None)
 
+	def __dispatch_ingest__(self):
+		from .ingest import decode_records, NUMPY_AVAILABLE
+		if not NUMPY_AVAILABLE:
+			logger.warning("Data listeners require numpy when process_ingest is enabled")
+			return
+		while self.streaming:
+			records = self.ingest.read_new()
+			if len(records) == 0 or not self.listeners:
+				time.sleep(0.005)
+				continue
+			start = clock()
+			packets = decode_records(records)
+			decoded = clock()
+			for jdata in packets:
+				self.__notify_listeners__(jdata)
+			if self.metrics is not None:
+				self.metrics.observe('decode', decoded - start)
+				self.metrics.observe('publish', clock() - decoded)
+				self.metrics.incr('packets', len(packets))
+
 	def __get_current_datetime__(self, timeformat=TOBII_DATETIME_FORMAT):
 		return datetime.datetime.now().replace(microsecond=0).strftime(timeformat)
 
 	def __get_request__(self, api_action):
+		urlopen, Request, URLError = _urllib()
 		url = self.base_url + api_action
+		start = clock() if self.metrics is not None else None
 		res = urlopen(url).read()
+		if start is not None:
+			self.metrics.observe('http_get', clock() - start, endpoint_name(api_action))
 		data = json.loads(res.decode('utf-8'))
 		return data
 
@@ -167,41 +202,48 @@ class TobiiGlassesController():
 		time.sleep(1)
 		while self.streaming:
 			try:
-				data, address = socket.recvfrom(1024)
-				jdata = json.loads(data.decode('utf-8'))
-				self.__refresh_data__(jdata)
+				metrics = self.metrics
+				if metrics is None:
+					data, address = socket.recvfrom(1024)
+					jdata = json.loads(data.decode('utf-8'))
+					self.__refresh_data__(jdata)
+					self.__notify_listeners__(jdata)
+				else:
+					t0 = clock()
+					data, address = socket.recvfrom(1024)
+					t1 = clock()
+					jdata = json.loads(data.decode('utf-8'))
+					t2 = clock()
+					self.__refresh_data__(jdata)
+					t3 = clock()
+					self.__notify_listeners__(jdata)
+					metrics.observe_packet(t1 - t0, t2 - t1, t3 - t2, clock() - t3, len(data))
 			except socket.timeout:
-				logging.error("A timeout occurred while receiving data")
+				logger.error("A timeout occurred while receiving data")
 				self.streaming = False
 
 	def __mksock__(self):
-		iptype = socket.AF_INET
-		if ':' in self.peer[0]:
-			iptype = socket.AF_INET6
-		res = socket.getaddrinfo(self.peer[0], self.peer[1], socket.AF_UNSPEC, socket.SOCK_DGRAM, 0, socket.AI_PASSIVE)
-		family, socktype, proto, canonname, sockaddr = res[0]
-		sock = socket.socket(family, socktype, proto)
-		sock.settimeout(5.0)
-		try:
-			if iptype == socket.AF_INET6:
-				sock.setsockopt(socket.SOL_SOCKET, 25, self.iface_name+'\0')
-		except socket.error as e:
-			if e.errno == 1:
-				logging.warning("Binding to a network interface is permitted only for root users.")
-		return sock
+		return mksock(self.peer, self.iface_name)
+
+	def __notify_listeners__(self, jsondata):
+		notify_listeners(self.listeners, jsondata)
 
 	def __post_request__(self, api_action, data=None, wait_for_response=True):
+		urlopen, Request, URLError = _urllib()
 		url = self.base_url + api_action
 		req = Request(url)
 		req.add_header('Content-Type', 'application/json')
 		data = json.dumps(data)
-		logging.debug("Sending JSON: " + str(data))
+		logger.debug("Sending JSON: %s", data)
 		if wait_for_response is False:
 			threading.Thread(target=urlopen, args=(req, data.encode('utf-8'),)).start()
 			return None
+		start = clock() if self.metrics is not None else None
 		response = urlopen(req, data.encode('utf-8'))
 		res = response.read()
-		logging.debug("Response: " + str(res))
+		if start is not None:
+			self.metrics.observe('http_post', clock() - start, endpoint_name(api_action))
+		logger.debug("Response: %s", res)
 		try:
 			res = json.loads(res.decode('utf-8'))
 		except:
@@ -210,76 +252,7 @@ class TobiiGlassesController():
 
 	def __refresh_data__(self, jsondata):
 		try:
-			gy = jsondata['gy']
-			ts = jsondata['ts']
-			if( (self.data['mems']['gy']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['mems']['gy'] = jsondata
-		except:
-			pass
-		try:
-			ac = jsondata['ac']
-			ts = jsondata['ts']
-			if( (self.data['mems']['ac']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['mems']['ac'] = jsondata
-		except:
-			pass
-		try:
-			pc = jsondata['pc']
-			ts = jsondata['ts']
-			eye = jsondata['eye']
-			if( (self.data[eye + '_eye']['pc']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data[eye + '_eye']['pc'] = jsondata
-		except:
-			pass
-		try:
-			pd = jsondata['pd']
-			ts = jsondata['ts']
-			eye = jsondata['eye']
-			if( (self.data[eye + '_eye']['pd']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data[eye + '_eye']['pd'] = jsondata
-		except:
-			pass
-		try:
-			gd = jsondata['gd']
-			ts = jsondata['ts']
-			eye = jsondata['eye']
-			if( (self.data[eye + '_eye']['gd']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data[eye + '_eye']['gd'] = jsondata
-		except:
-			pass
-		try:
-			gp = jsondata['gp']
-			ts = jsondata['ts']
-			if( (self.data['gp']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['gp'] = jsondata
-		except:
-			pass
-		try:
-			gp3 = jsondata['gp3']
-			ts = jsondata['ts']
-			if( (self.data['gp3']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['gp3'] = jsondata
-		except:
-			pass
-		try:
-			pts = jsondata['pts']
-			ts = jsondata['ts']
-			if( (self.data['pts']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['pts'] = jsondata
-		except:
-			pass
-		try:
-			vts = jsondata['vts']
-			ts = jsondata['ts']
-			if( (self.data['vts']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['vts'] = jsondata
-		except:
-			pass
-		try:
-			pv = jsondata['pv']
-			ts = jsondata['ts']
-			if( (self.data['pv']['ts'] < ts) and (jsondata['s'] == 0) ):
-				self.data['pv'] = jsondata
+			refresh_data(self.data, jsondata)
 		except:
 			pass
 
@@ -297,46 +270,99 @@ class TobiiGlassesController():
 
 	def __start_streaming__(self):
 		self.streaming = True
-		self.td = threading.Timer(0, self.__send_keepalive_msg__, [self.data_socket, self.KA_DATA_MSG])
-		self.tg = threading.Timer(0, self.__grab_data__, [self.data_socket])
 		if self.video_scene:
 			self.tv = threading.Timer(0, self.__send_keepalive_msg__, [self.video_socket, self.KA_VIDEO_MSG])
 			self.tv.start()
-			logging.debug("Video streaming started...")
-		self.td.start()
-		self.tg.start()
-		logging.debug("Data streaming started...")
+			logger.debug("Video streaming started...")
+		if self.process_ingest:
+			from .ingest import ProcessIngest
+			if self.ingest is None:
+				self.ingest = ProcessIngest(self.peer, self.iface_name, self.KA_DATA_MSG, ka_interval=self.timeout)
+			self.ingest.start()
+			self.tg = threading.Timer(0, self.__dispatch_ingest__)
+			self.tg.start()
+		else:
+			self.td = threading.Timer(0, self.__send_keepalive_msg__, [self.data_socket, self.KA_DATA_MSG])
+			self.tg = threading.Timer(0, self.__grab_data__, [self.data_socket])
+			self.td.start()
+			self.tg.start()
+		logger.debug("Data streaming started...")
+
+	def add_data_listener(self, listener):
+		"""Calls listener(packet) from the streaming thread for every received packet."""
+		self.listeners.append(listener)
 
 	def close(self):
-		if self.address is not None:
+		if self.data_socket is not None:
 			if self.streaming:
 				self.stop_streaming()
+			if self.ingest is not None:
+				self.ingest.close()
+				self.ingest = None
 			self.__disconnect__()
 
+	def connect(self, timeout = None, blocking = True):
+		"""Discovers the device (if no address was given) and connects to it.
+
+		Called by the constructor unless connect=False. With blocking=False the
+		connection runs in a background thread and a concurrent.futures.Future
+		is returned.
+		"""
+		if blocking is False:
+			from concurrent.futures import Future
+			future = Future()
+			def run():
+				try:
+					future.set_result(self.connect(timeout = timeout))
+				except BaseException as e:
+					future.set_exception(e)
+			t = threading.Thread(target=run)
+			t.daemon = True
+			t.start()
+			return future
+		if self.address is None:
+			data, address = self.__discover_device__()
+			if address is None:
+				raise ConnectionError("No device found using discovery process")
+			else:
+				try:
+					self.address = data["ipv4"]
+				except:
+					self.address = address
+		if "%" in self.address:
+			if sys.platform == "win32":
+				self.address,self.iface_name = self.address.split("%")
+			else:
+				self.iface_name = self.address.split("%")[1]
+		self.__set_URL__(self.udpport, self.address)
+		if self.__connect__(timeout = timeout) is False:
+			raise ConnectionError("Failed to connect to Tobii device")
+		return True
+
 	def create_calibration(self, project_id, participant_id):
 		data = {'ca_project': project_id, 'ca_type': 'default',
 				'ca_participant': participant_id,
 				'ca_created': self.__get_current_datetime__()}
 		json_data = self.__post_request__('/api/calibrations', data)
-		logging.debug("Calibration " + json_data['ca_id'] + "created! Project: " + project_id + ", Participant: " + participant_id)
+		self.get_registry().add('calibrations', json_data)
+		logger.debug("Calibration %s created! Project: %s, Participant: %s", json_data['ca_id'], project_id, participant_id)
 		return json_data['ca_id']
 
 	def create_participant(self, project_id, participant_name = "DefaultUser", participant_notes = ""):
-		participant_id = self.get_participant_id(participant_name)
 		self.participant_name = participant_name
+		return self.__create_participant__(project_id, participant_name, participant_notes)
 
-		if participant_id is None:
-			data = {'pa_project': project_id,
-					'pa_info': { 'EagleId': str(uuid.uuid5(uuid.NAMESPACE_DNS, self.participant_name)),
-								 'Name': self.participant_name,
-								 'Notes': participant_notes},
-					'pa_created': self.__get_current_datetime__()}
-			json_data = self.__post_request__('/api/participants', data)
-			logging.debug("Participant " + json_data['pa_id'] + " created! Project " + project_id)
-			return json_data['pa_id']
-		else:
-			logging.debug("Participant %s already exists ..." % participant_id)
-			return participant_id
+	def create_participants(self, project_id, participant_names, participant_notes = "", workers = 4):
+		"""Creates the participants that do not exist yet, with up to workers concurrent requests.
+
+		Returns the participant ids in the order of participant_names.
+		"""
+		from concurrent.futures import ThreadPoolExecutor
+		names = list(dict.fromkeys(participant_names))
+		self.get_registry()
+		with ThreadPoolExecutor(max_workers=workers) as pool:
+			ids = dict(zip(names, pool.map(lambda name: self.__create_participant__(project_id, name, participant_notes), names)))
+		return [ids[name] for name in participant_names]
 
 	def create_project(self, projectname = "DefaultProjectName"):
 		project_id = self.get_project_id(projectname)
@@ -347,10 +373,11 @@ class TobiiGlassesController():
 								 'Name': projectname},
 					'pr_created': self.__get_current_datetime__() }
 			json_data = self.__post_request__('/api/projects', data)
-			logging.debug("Project %s created!" % json_data['pr_id'])
+			self.get_registry().add('projects', json_data)
+			logger.debug("Project %s created!", json_data['pr_id'])
 			return json_data['pr_id']
 		else:
-			logging.debug("Project %s already exists ..." % project_id)
+			logger.debug("Project %s already exists ...", project_id)
 			return project_id
 
 	def create_recording(self, participant_id, recording_notes = ""):
@@ -362,6 +389,7 @@ class TobiiGlassesController():
 							 'Notes': recording_notes},
 							 'rec_created': self.__get_current_datetime__()}
 		json_data = self.__post_request__('/api/recordings', data)
+		self.get_registry().add('recordings', json_data)
 		return json_data['rec_id']
 
 	def eject_sd(self):
@@ -388,16 +416,20 @@ class TobiiGlassesController():
 	def get_et_frequencies(self):
 		return self.get_status()['sys_et']['frequencies']
 
+	def get_metrics(self):
+		"""Stage timings and counters, empty unless enable_metrics() was called."""
+		if self.metrics is None:
+			return {}
+		return self.metrics.get_metrics()
+
+	def get_metrics_text(self):
+		"""get_metrics() in the Prometheus text exposition format."""
+		if self.metrics is None:
+			return ''
+		return self.metrics.to_prometheus()
+
 	def get_participant_id(self, participant_name):
-		participant_id = None
-		participants = self.__get_request__('/api/participants')
-		for participant in participants:
-			try:
-				if participant['pa_info']['Name'] == participant_name:
-					participant_id = participant['pa_id']
-			except:
-				pass
-		return participant_id
+		return self.get_registry().find('participants', participant_name)
 
 	def identify(self):
 		self.__get_request__('/api/identify')
@@ -410,39 +442,68 @@ class TobiiGlassesController():
 		return False
 
 	def is_streaming(self):
+		if self.ingest is not None:
+			return self.streaming and self.ingest.is_alive()
 		return self.streaming
 
+	def enable_metrics(self, enabled = True):
+		"""Turns on (or off) the timing of the streaming stages and HTTP requests."""
+		from .metrics import Metrics
+		self.metrics = Metrics() if enabled else None
+
 	def get_address(self):
 		return self.address
 
+	def get_clock_sync(self):
+		"""Estimator of the device ts to host clock mapping, fed by the data stream."""
+		if self.clock_sync is None:
+			from .clocksync import ClockSync
+			self.clock_sync = ClockSync()
+			self.add_data_listener(self.clock_sync.push)
+		return self.clock_sync
+
 	def get_configuration(self):
 		return self.__get_request__('/api/system/conf')
 
 	def get_data(self):
+		if self.ingest is not None:
+			return self.ingest.get_data()
 		return self.data
 
 	def get_participants(self):
-		return self.__get_request__('/api/participants')
+		objects = self.__get_request__('/api/participants')
+		self.get_registry().update('participants', objects)
+		return objects
 
 	def get_projects(self):
-		return self.__get_request__('/api/projects')
+		objects = self.__get_request__('/api/projects')
+		self.get_registry().update('projects', objects)
+		return objects
 
 	def get_project_id(self, project_name):
-		project_id = None
-		projects = self.__get_request__('/api/projects')
-		for project in projects:
-			try:
-				if project['pr_info']['Name'] == project_name:
-					project_id = project['pr_id']
-			except:
-				pass
-		return project_id
+		return self.get_registry().find('projects', project_name)
+
+	def get_window(self, key, n, eye = None):
+		"""Last n samples of a channel as a numpy structured array. Requires process_ingest."""
+		if self.ingest is None:
+			logger.error("Sample windows are available only with process_ingest enabled")
+			return None
+		return self.ingest.get_window(key, n, eye)
+
+	def get_registry(self):
+		"""Local index of the device objects used for the lookups by name."""
+		if self.registry is None:
+			from .registry import DeviceRegistry
+			self.registry = DeviceRegistry(self)
+		return self.registry
 
 	def get_recording_status(self):
 		return self.get_status()['sys_recording']
 
 	def get_recordings(self):
-		return self.__get_request__('/api/recordings')
+		objects = self.__get_request__('/api/recordings')
+		self.get_registry().update('recordings', objects)
+		return objects
 
 	def get_status(self):
 		return self.__get_request__('/api/system/status')
@@ -463,6 +524,9 @@ class TobiiGlassesController():
 		self.__post_request__('/api/recordings/' + recording_id + '/pause')
 		return self.wait_for_recording_status(recording_id, ['paused']) == "paused"
 
+	def remove_data_listener(self, listener):
+		self.listeners.remove(listener)
+
 	def send_custom_event(self, event_type, event_tag = ''):
 		data = {'type': event_type, 'tag': event_tag}
 		self.__post_request__('/api/events', data, wait_for_response=False)
@@ -519,61 +583,68 @@ class TobiiGlassesController():
 		return False
 
 	def start_streaming(self):
-		logging.debug("Start streaming ...")
+		logger.debug("Start streaming ...")
 		try:
 			self.__start_streaming__()
 		except:
-			logging.error("An error occurs trying to connect to the Tobii Pro Glasses")
+			logger.error("An error occurs trying to connect to the Tobii Pro Glasses")
 
 	def stop_recording(self, recording_id):
 		self.__post_request__('/api/recordings/' + recording_id + '/stop')
 		return self.wait_for_recording_status(recording_id, ['done']) == "done"
 
 	def stop_streaming(self):
-		logging.debug("Stop data streaming ...")
+		logger.debug("Stop data streaming ...")
 		try:
 			if self.streaming:
 				self.streaming = False
-				self.td.join()
 				self.tg.join()
+				if self.ingest is not None:
+					self.ingest.stop()
+				else:
+					self.td.join()
 				if self.video_scene:
 					self.tv.join()
-			logging.debug("Data streaming successful stopped!")
+			logger.debug("Data streaming successful stopped!")
 		except:
-			logging.error("An error occurs trying to stop data streaming")
+			logger.error("An error occurs trying to stop data streaming")
 
 	def wait_for_recording_status(self, recording_id, status_array = ['init', 'starting',
 	'recording', 'pausing', 'paused', 'stopping', 'stopped', 'done', 'stale', 'failed'], timeout = None):
 		return self.wait_for_status('/api/recordings/' + recording_id + '/status', 'rec_state', status_array, timeout)
 
 	def wait_for_status(self, api_action, key, values, timeout = None):
+		urlopen, Request, URLError = _urllib()
 		url = self.base_url + api_action
 		running = True
 		while running:
 			req = Request(url)
 			req.add_header('Content-Type', 'application/json')
+			start = clock() if self.metrics is not None else None
 			try:
 				response = urlopen(req, None, timeout = timeout)
 			except URLError as e:
-				logging.error(e.reason)
+				logger.error(e.reason)
 				return -1
 			data = response.read()
+			if start is not None:
+				self.metrics.observe('http_get', clock() - start, endpoint_name(api_action))
 			json_data = json.loads(data.decode('utf-8'))
 			if json_data[key] in values:
 				running = False
-			time.sleep(1)
+			else:
+				time.sleep(self.poll_interval)
 		return json_data[key]
 
 	def wait_until_calibration_is_done(self, calibration_id, timeout = None):
-		while True:
-			status = self.wait_for_status('/api/calibrations/' + calibration_id + '/status', 'ca_state', ['calibrating', 'calibrated', 'stale', 'uncalibrated', 'failed'], timeout)
-			logging.debug("Calibration status %s" % status)
-			if status == 'uncalibrated' or status == 'stale' or status == 'failed':
-				logging.debug("Calibration %s failed " % calibration_id)
-				return False
-			elif status == 'calibrated':
-				logging.debug("Calibration %s successful " % calibration_id)
-				return True
+		# wait_for_status polls every poll_interval until one of the final states
+		status = self.wait_for_status('/api/calibrations/' + calibration_id + '/status', 'ca_state', ['calibrated', 'stale', 'uncalibrated', 'failed'], timeout)
+		logger.debug("Calibration status %s", status)
+		if status == 'calibrated':
+			logger.debug("Calibration %s successful ", calibration_id)
+			return True
+		logger.debug("Calibration %s failed ", calibration_id)
+		return False
 
 	def wait_until_status_is_ok(self, timeout = None):
 		status = self.wait_for_status('/api/system/status', 'sys_status', ['ok'], timeout)
@@ -0,0 +1,145 @@
+# drift.py: Online correction of the gaze drift from known targets
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from .packets import GazeBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def design_matrix(xy, degree):
+	"""Features of the correction: 1, x, y for affine (degree 1), plus x^2, xy, y^2 for degree 2."""
+	x, y = xy[:, 0], xy[:, 1]
+	columns = [np.ones(len(xy)), x, y]
+	if degree >= 2:
+		columns += [x * x, x * y, y * y]
+	return np.column_stack(columns)
+
+def identity_coefficients(degree):
+	coef = np.zeros((3 if degree == 1 else 6, 2))
+	coef[1, 0] = coef[2, 1] = 1.0
+	return coef
+
+
+class DriftCorrector(GazeBuffer):
+	"""Affine (degree=1) or quadratic (degree=2) re-mapping of gp fitted on
+	fixations of known targets, to compensate the drift of the calibration
+	without stopping the session.
+
+	add_target() records the gaze (e.g. a Scanpath fixation) measured while
+	the participant looked at a known target, fit() solves a least squares
+	problem on the last max_points pairs, regularized towards the identity so
+	that a few points give a mild correction. Every fit creates a new
+	version of the coefficients: apply() uses the latest one unless a version
+	is given, rollback() returns to a previous one, get_state() and
+	set_state() save and restore them.
+
+	push() can be registered with TobiiGlassesController.add_data_listener;
+	update() corrects the buffered gp samples as one batch.
+	"""
+
+	def __init__(self, degree=1, max_points=50, regularization=1e-3, min_points=3):
+		GazeBuffer.__init__(self)
+		if degree not in (1, 2):
+			raise ValueError("Unsupported correction degree %d" % degree)
+		self.degree = degree
+		self.regularization = regularization
+		self.min_points = min_points
+		self.points = deque(maxlen=max_points)
+		self.versions = [(0, None, identity_coefficients(degree))]
+		self.current = self.versions[0]
+		self.lock = threading.Lock()
+
+	def add_target(self, target, gaze, weight=1.0, ts=None):
+		"""Adds the gaze (x, y) measured while looking at target (x, y)."""
+		with self.lock:
+			self.points.append((target[0], target[1], gaze[0], gaze[1], weight, ts))
+
+	def add_fixation(self, target, fixation):
+		"""Adds a Scanpath fixation (start ts, duration, x, y), weighted by its duration."""
+		self.add_target(target, fixation[2:4], weight=fixation[1] * 1e-6, ts=fixation[0])
+
+	def fit(self):
+		"""Fits a new version on the current points, returns its number (None if too few points)."""
+		with self.lock:
+			points = np.array(self.points, dtype=np.float64)
+		if len(points) < self.min_points:
+			return None
+		features = design_matrix(points[:, 2:4], self.degree)
+		w = points[:, 4:5]
+		identity = identity_coefficients(self.degree)
+		lam = self.regularization * w.sum()
+		a = np.dot(features.T, features * w) + lam * np.eye(features.shape[1])
+		b = np.dot(features.T, points[:, 0:2] * w) + lam * identity
+		coef = np.linalg.solve(a, b)
+		residual = np.sqrt(np.mean(np.sum((np.dot(features, coef) - points[:, 0:2]) ** 2, axis=1)))
+		ts = int(np.nanmax(points[:, 5])) if not np.isnan(points[:, 5]).all() else None
+		with self.lock:
+			version = (self.versions[-1][0] + 1, ts, coef)
+			self.versions.append(version)
+			self.current = version
+		logger.debug("Drift correction v%d fitted on %d points, residual %.4f", version[0], len(points), residual)
+		return version[0]
+
+	def get_version(self):
+		return self.current[0]
+
+	def get_coefficients(self, version=None):
+		if version is None:
+			return self.current[2]
+		for v in self.versions:
+			if v[0] == version:
+				return v[2]
+		raise KeyError("Unknown drift correction version %s" % str(version))
+
+	def rollback(self, version):
+		"""Makes an earlier version the current one (0 is no correction)."""
+		coef = self.get_coefficients(version)
+		with self.lock:
+			self.current = [v for v in self.versions if v[0] == version][0]
+		return coef
+
+	def apply(self, xy, version=None):
+		"""Corrects an (n, 2) array of gaze points."""
+		xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+		return np.dot(design_matrix(xy, self.degree), self.get_coefficients(version))
+
+	def update(self):
+		"""Corrects the buffered samples, returns (ts, corrected xy, version)."""
+		pending = self.pop_pending()
+		if not pending:
+			return np.zeros(0, dtype=np.int64), np.zeros((0, 2)), self.get_version()
+		samples = np.array(pending, dtype=np.float64)
+		version, ts, coef = self.current
+		return samples[:, 0].astype(np.int64), np.dot(design_matrix(samples[:, 1:], self.degree), coef), version
+
+	def get_state(self):
+		"""JSON serializable state: the versions and the current one."""
+		return {'degree': self.degree, 'current': self.current[0],
+				'versions': [{'version': v, 'ts': ts, 'coefficients': coef.tolist()} for v, ts, coef in self.versions]}
+
+	def set_state(self, state):
+		if state['degree'] != self.degree:
+			raise ValueError("Cannot load a degree %d correction into a degree %d one" % (state['degree'], self.degree))
+		with self.lock:
+			self.versions = [(v['version'], v['ts'], np.array(v['coefficients'], dtype=np.float64)) for v in state['versions']]
+			self.current = [v for v in self.versions if v[0] == state['current']][0]
@@ -0,0 +1,279 @@
+# export.py: Columnar export of the live data streams
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import re
+import gzip
+import json
+import logging
+import threading
+import zipfile
+import importlib.util
+
+import numpy as np
+
+from .packets import PACKET_KEYS, EYE_KEYS
+from .ingest import encode_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 65536
+
+# Value columns of each table, besides ts, s, gidx (and eye for the eye tables)
+TABLE_COLUMNS = {'ac': ('x', 'y', 'z'), 'gy': ('x', 'y', 'z'),
+				 'pc': ('x', 'y', 'z'), 'pd': ('pd',), 'gd': ('x', 'y', 'z'),
+				 'gp': ('x', 'y', 'l'), 'gp3': ('x', 'y', 'z'),
+				 'pts': ('pts', 'pv'), 'vts': ('vts',)}
+
+FORMATS = ('parquet', 'arrow', 'hdf5', 'npz')
+
+
+def _has_module(name):
+	return importlib.util.find_spec(name) is not None
+
+def default_format():
+	if _has_module('pyarrow'):
+		return 'parquet'
+	if _has_module('h5py'):
+		return 'hdf5'
+	return 'npz'
+
+def record_columns(key, records):
+	"""Splits the records of one channel into typed columns."""
+	columns = {'ts': records['ts'], 's': records['s'], 'gidx': records['gidx']}
+	if key in EYE_KEYS:
+		columns['eye'] = records['eye']
+	v = records['v']
+	if key == 'pts':
+		columns['pts'] = records['iv']
+		columns['pv'] = np.where(np.isnan(v[:, 0]), -1, v[:, 0]).astype(np.int64)
+	elif key == 'vts':
+		columns['vts'] = records['iv']
+	elif key == 'pd':
+		columns['pd'] = v[:, 0]
+	else:
+		for i, name in enumerate(TABLE_COLUMNS[key]):
+			columns[name] = records['l'] if name == 'l' else v[:, i]
+	return dict((name, np.ascontiguousarray(c)) for name, c in columns.items())
+
+
+class _ParquetWriter(object):
+
+	def __init__(self, path, ipc=False):
+		import pyarrow
+		self.pa = pyarrow
+		self.path = path
+		self.ipc = ipc
+		self.writers = {}
+		if not os.path.isdir(path):
+			os.makedirs(path)
+
+	def write(self, table, columns):
+		batch = self.pa.table(columns)
+		writer = self.writers.get(table)
+		if writer is None:
+			if self.ipc:
+				writer = self.pa.ipc.new_file(os.path.join(self.path, table + '.arrow'), batch.schema)
+			else:
+				import pyarrow.parquet
+				writer = pyarrow.parquet.ParquetWriter(os.path.join(self.path, table + '.parquet'), batch.schema)
+			self.writers[table] = writer
+		writer.write_table(batch)
+
+	def close(self):
+		for writer in self.writers.values():
+			writer.close()
+		self.writers = {}
+
+
+class _HDF5Writer(object):
+
+	def __init__(self, path):
+		import h5py
+		self.h5 = h5py.File(path, 'w')
+
+	def write(self, table, columns):
+		group = self.h5.require_group(table)
+		for name, column in columns.items():
+			if name not in group:
+				group.create_dataset(name, data=column, maxshape=(None,), chunks=True)
+			else:
+				dataset = group[name]
+				n = dataset.shape[0]
+				dataset.resize((n + len(column),))
+				dataset[n:] = column
+
+	def close(self):
+		self.h5.close()
+
+
+class _NPZWriter(object):
+	"""Writes every chunk as a separate table/column/NNNNNN.npy member."""
+
+	def __init__(self, path):
+		self.zf = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+		self.chunks = {}
+
+	def write(self, table, columns):
+		n = self.chunks.get(table, 0)
+		for name, column in columns.items():
+			with self.zf.open('%s/%s/%06d.npy' % (table, name, n), 'w', force_zip64=True) as f:
+				np.lib.format.write_array(f, column, allow_pickle=False)
+		self.chunks[table] = n + 1
+
+	def close(self):
+		self.zf.close()
+
+
+def _open_writer(path, fmt):
+	if fmt == 'parquet':
+		return _ParquetWriter(path)
+	if fmt == 'arrow':
+		return _ParquetWriter(path, ipc=True)
+	if fmt == 'hdf5':
+		return _HDF5Writer(path)
+	if fmt == 'npz':
+		return _NPZWriter(path)
+	raise ValueError("Unknown export format %s, use one of %s" % (fmt, str(FORMATS)))
+
+
+class ColumnarExporter(object):
+	"""Writes the live data as one columnar table per channel.
+
+	Packets are pushed one by one (push() can be registered with
+	TobiiGlassesController.add_data_listener) or as record arrays
+	(push_records()) and written in chunks of at most chunk_size rows, so
+	memory is bounded whatever the length of the session. parquet and arrow
+	write a directory with one file per table and need pyarrow, hdf5 needs
+	h5py, npz only numpy. Call close() to flush the last chunks.
+	"""
+
+	def __init__(self, path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+		self.path = path
+		self.format = fmt or default_format()
+		self.chunk_size = chunk_size
+		self.writer = _open_writer(path, self.format)
+		self.pending = []
+		self.buffers = dict((key, []) for key in PACKET_KEYS)
+		self.buffered = dict((key, 0) for key in PACKET_KEYS)
+		self.lock = threading.Lock()
+		logger.debug("Exporting to %s (%s)", path, self.format)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def push(self, packet):
+		with self.lock:
+			self.pending.append(packet)
+			if len(self.pending) >= self.chunk_size:
+				self.__flush_pending__()
+
+	def push_records(self, records):
+		with self.lock:
+			self.__flush_pending__()
+			self.__add_records__(records)
+
+	def __flush_pending__(self):
+		if self.pending:
+			records = encode_records(self.pending)
+			self.pending = []
+			self.__add_records__(records)
+
+	def __add_records__(self, records):
+		ch = records['ch']
+		for i, key in enumerate(PACKET_KEYS):
+			selected = records[ch == i + 1]
+			if len(selected) == 0:
+				continue
+			self.buffers[key].append(selected)
+			self.buffered[key] += len(selected)
+			if self.buffered[key] >= self.chunk_size:
+				self.__write_table__(key)
+
+	def __write_table__(self, key):
+		if self.buffered[key] == 0:
+			return
+		records = np.concatenate(self.buffers[key])
+		self.buffers[key] = []
+		self.buffered[key] = 0
+		for start in range(0, len(records), self.chunk_size):
+			self.writer.write(key, record_columns(key, records[start:start + self.chunk_size]))
+
+	def flush(self):
+		with self.lock:
+			self.__flush_pending__()
+			for key in PACKET_KEYS:
+				self.__write_table__(key)
+
+	def close(self):
+		if self.writer is not None:
+			self.flush()
+			self.writer.close()
+			self.writer = None
+
+
+def export_packets(packets, path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Exports an iterable of packet dictionaries."""
+	with ColumnarExporter(path, fmt, chunk_size) as exporter:
+		for packet in packets:
+			exporter.push(packet)
+	return path
+
+def read_json_lines(path):
+	"""Yields the packets of a JSON-lines capture (gzipped if it ends with .gz)."""
+	opener = gzip.open if path.endswith('.gz') else open
+	with opener(path, 'rt') as f:
+		for line in f:
+			line = line.strip()
+			if line:
+				yield json.loads(line)
+
+def load_export(path):
+	"""Loads an export as {table: {column: numpy array}}."""
+	tables = {}
+	if os.path.isdir(path):
+		import pyarrow
+		for name in sorted(os.listdir(path)):
+			table, ext = os.path.splitext(name)
+			if ext == '.parquet':
+				import pyarrow.parquet
+				data = pyarrow.parquet.read_table(os.path.join(path, name))
+			elif ext == '.arrow':
+				data = pyarrow.ipc.open_file(pyarrow.memory_map(os.path.join(path, name))).read_all()
+			else:
+				continue
+			tables[table] = dict((c, data.column(c).to_numpy()) for c in data.column_names)
+	elif zipfile.is_zipfile(path):
+		chunks = {}
+		with zipfile.ZipFile(path) as zf:
+			for name in sorted(zf.namelist()):
+				m = re.match(r'(\w+)/(\w+)/(\d+)\.npy$', name)
+				if m is None:
+					continue
+				with zf.open(name) as f:
+					chunks.setdefault(m.group(1), {}).setdefault(m.group(2), []).append(np.lib.format.read_array(f))
+		for table, columns in chunks.items():
+			tables[table] = dict((c, np.concatenate(a)) for c, a in columns.items())
+	else:
+		import h5py
+		with h5py.File(path, 'r') as h5:
+			for table in h5:
+				tables[table] = dict((c, h5[table][c][()]) for c in h5[table])
+	return tables
@@ -0,0 +1,171 @@
+# heatmap.py: Incremental gaze heatmaps and scanpaths
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import math
+from collections import deque
+
+import numpy as np
+
+from .packets import GazeBuffer
+
+# Bound of the lazy decay scale, the counts are renormalized before it is exceeded
+MAX_SCALE = 1e100
+MAX_GROWTH = math.log(MAX_SCALE)
+
+
+def gaussian_kernel(sigma):
+	radius = max(int(math.ceil(3 * sigma)), 1)
+	x = np.arange(-radius, radius + 1, dtype=np.float64)
+	kernel = np.exp(-0.5 * (x / sigma) ** 2)
+	return kernel / kernel.sum()
+
+def blur(image, sigma):
+	"""Separable Gaussian blur (zero padded) of a 2D array, sigma in cells."""
+	if sigma <= 0:
+		return image.copy()
+	kernel = gaussian_kernel(sigma)
+	radius = len(kernel) // 2
+	out = image
+	for axis in (0, 1):
+		padding = [(0, 0), (0, 0)]
+		padding[axis] = (radius, radius)
+		padded = np.pad(out, padding)
+		n = out.shape[axis]
+		acc = np.zeros_like(out)
+		for k, w in enumerate(kernel):
+			acc += w * (padded[k:k + n] if axis == 0 else padded[:, k:k + n])
+		out = acc
+	return out
+
+
+class GazeHeatmap(GazeBuffer):
+	"""Fixed-resolution 2D histogram of gaze points in normalized scene coordinates.
+
+	push() can be registered with TobiiGlassesController.add_data_listener
+	(valid gp samples are buffered until the next update() or render());
+	add_batch() bins arrays directly. With half_life (seconds of device
+	time) older samples fade out, for live views. The blur is applied only
+	by render(), and maps of other participants or processes with the same
+	shape can be merged with merge(). Memory does not depend on the number
+	of samples.
+	"""
+
+	def __init__(self, width=160, height=90, half_life=None):
+		GazeBuffer.__init__(self)
+		self.width = width
+		self.height = height
+		self.rate = None if half_life is None else math.log(2) / (half_life * 1e6)
+		self.counts = np.zeros((height, width), dtype=np.float64)
+		# Decay is applied lazily: the actual counts are counts / scale
+		self.scale = 1.0
+		self.ts = None
+
+	def update(self):
+		pending = self.pop_pending()
+		if pending:
+			samples = np.array(pending, dtype=np.float64)
+			self.add_batch(samples[:, 1:], samples[:, 0])
+
+	def add_batch(self, xy, ts=None):
+		xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+		ok = np.isfinite(xy).all(axis=1) & (xy[:, 0] >= 0) & (xy[:, 0] < 1) & (xy[:, 1] >= 0) & (xy[:, 1] < 1)
+		weights = np.ones(len(xy))
+		if self.rate is not None and ts is not None and len(xy) > 0:
+			ts = np.asarray(ts, dtype=np.float64)
+			if self.ts is None:
+				self.ts = ts[0]
+			# Move the reference time to the last sample: the stored counts decay by growing the scale
+			growth = self.rate * (ts[-1] - self.ts)
+			if growth > MAX_GROWTH:
+				# The stored counts decayed below 1 / MAX_SCALE of a new sample
+				self.counts[:] = 0.0
+				self.scale = 1.0
+			elif growth > math.log(MAX_SCALE / self.scale):
+				self.counts /= self.scale
+				self.scale = 1.0
+			self.scale *= math.exp(min(growth, MAX_GROWTH))
+			self.ts = ts[-1]
+			weights = np.exp(-self.rate * (self.ts - ts)) * self.scale
+		cells = (xy[ok, 1] * self.height).astype(np.int64) * self.width + (xy[ok, 0] * self.width).astype(np.int64)
+		self.counts += np.bincount(cells, weights=weights[ok], minlength=self.width * self.height).reshape(self.height, self.width)
+
+	def get_counts(self):
+		"""The (decayed) sample counts of the cells."""
+		self.update()
+		return self.counts / self.scale
+
+	def merge(self, other):
+		"""Adds the counts of another heatmap (or array) of the same shape."""
+		counts = other.get_counts() if isinstance(other, GazeHeatmap) else np.asarray(other)
+		if counts.shape != self.counts.shape:
+			raise ValueError("Cannot merge a %s heatmap into a %s one" % (str(counts.shape), str(self.counts.shape)))
+		self.counts += counts * self.scale
+
+	def render(self, sigma=2.0, normalize=True):
+		"""Blurred heatmap (height x width), scaled to a maximum of 1 if normalize."""
+		image = blur(self.get_counts(), sigma)
+		if normalize and image.max() > 0:
+			image /= image.max()
+		return image
+
+
+class Scanpath(object):
+	"""Incremental dispersion-threshold (I-DT) fixation detection.
+
+	A fixation is a run of samples lasting at least min_duration
+	microseconds whose dispersion ((max x - min x) + (max y - min y)) stays
+	below max_dispersion. The last max_fixations fixations are kept as
+	(start ts, duration, x, y) tuples.
+	"""
+
+	def __init__(self, max_dispersion=0.03, min_duration=100000, max_fixations=1000):
+		self.max_dispersion = max_dispersion
+		self.min_duration = min_duration
+		self.fixations = deque(maxlen=max_fixations)
+		self.__start__(None, 0.0, 0.0)
+		self.n = 0
+
+	def __start__(self, ts, x, y):
+		self.start = self.end = ts
+		self.xmin = self.xmax = self.sx = x
+		self.ymin = self.ymax = self.sy = y
+		self.n = 1
+
+	def push(self, packet):
+		if 'gp' in packet and packet.get('s') == 0:
+			self.add(packet['ts'], packet['gp'][0], packet['gp'][1])
+
+	def add(self, ts, x, y):
+		if self.n == 0:
+			self.__start__(ts, x, y)
+			return
+		xmin, xmax = min(self.xmin, x), max(self.xmax, x)
+		ymin, ymax = min(self.ymin, y), max(self.ymax, y)
+		if (xmax - xmin) + (ymax - ymin) > self.max_dispersion:
+			# The new sample breaks the window: close the fixation made by the previous ones
+			if self.n > 1 and self.end - self.start >= self.min_duration:
+				self.fixations.append((self.start, self.end - self.start, self.sx / self.n, self.sy / self.n))
+			self.__start__(ts, x, y)
+			return
+		self.xmin, self.xmax, self.ymin, self.ymax = xmin, xmax, ymin, ymax
+		self.sx += x
+		self.sy += y
+		self.n += 1
+		self.end = ts
+
+	def get_fixations(self):
+		return list(self.fixations)
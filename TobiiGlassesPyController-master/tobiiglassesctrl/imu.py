@@ -0,0 +1,158 @@
+# imu.py: Head orientation from the MEMS accelerometer and gyroscope
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import threading
+
+import numpy as np
+
+# Scene camera field of view of the Tobii Pro Glasses 2 (degrees)
+SCENE_HFOV = 82.0
+SCENE_VFOV = 52.0
+
+
+def accel_tilt(ac):
+	"""Pitch (about x) and roll (about z) in degrees from the gravity measured by
+	the accelerometer, with the y axis of the head unit pointing up."""
+	pitch = np.degrees(np.arctan2(-ac[:, 2], ac[:, 1]))
+	roll = np.degrees(np.arctan2(ac[:, 0], ac[:, 1]))
+	return pitch, roll
+
+
+class HeadMotionEstimator(object):
+	"""Complementary filter estimating the head orientation from the mems channels.
+
+	Pitch and roll blend the integrated gyroscope (deg/s) with the
+	accelerometer tilt, yaw is the integrated gyroscope alone (it drifts,
+	use set_reference() to re-anchor it). Angles are in degrees and follow
+	the right-hand rule on the head unit axes (x left, y up, z forward).
+
+	The filter y[k] = a * (y[k-1] + w[k] * dt[k]) + (1 - a) * tilt[k] is a
+	linear recurrence, so a batch of samples is solved in closed form with
+	cumulative sums and the powers of a precomputed for chunks of chunk
+	samples, without a Python loop per sample. push() can be registered with
+	TobiiGlassesController.add_data_listener; update() processes the
+	buffered samples.
+	"""
+
+	def __init__(self, rate=100.0, time_constant=0.5, chunk=256, history=2048):
+		dt = 1.0 / rate
+		self.a = time_constant / (time_constant + dt)
+		self.chunk = chunk
+		self.powers = self.a ** np.arange(1, chunk + 1)
+		self.state = None
+		self.last_ts = None
+		self.last_ac = None
+		self.reference = np.zeros(3)
+		self.history = np.zeros((history, 4))
+		self.count = 0
+		self.pending_ac = []
+		self.pending_gy = []
+		self.lock = threading.Lock()
+
+	def push(self, packet):
+		if packet.get('s') != 0:
+			return
+		if 'gy' in packet:
+			with self.lock:
+				self.pending_gy.append([packet['ts']] + list(packet['gy']))
+		elif 'ac' in packet:
+			with self.lock:
+				self.pending_ac.append([packet['ts']] + list(packet['ac']))
+
+	def update(self):
+		"""Processes the buffered samples, returns their (ts, pitch, roll, yaw) rows."""
+		with self.lock:
+			gy, self.pending_gy = self.pending_gy, []
+			ac, self.pending_ac = self.pending_ac, []
+		if ac:
+			ac = np.array(ac, dtype=np.float64)
+			if self.last_ac is not None:
+				ac = np.vstack([self.last_ac, ac])
+			self.last_ac = ac[-1:]
+		elif self.last_ac is not None:
+			ac = self.last_ac
+		if not gy or ac is None or len(ac) == 0:
+			with self.lock:
+				self.pending_gy = gy + self.pending_gy
+			return np.zeros((0, 4))
+		gy = np.array(gy, dtype=np.float64)
+		acc = np.column_stack([np.interp(gy[:, 0], ac[:, 0], ac[:, i]) for i in (1, 2, 3)])
+		return self.process(gy[:, 0], gy[:, 1:], acc)
+
+	def process(self, ts, gy, ac):
+		"""Filters gyroscope samples with the accelerometer interpolated at the same ts."""
+		ts = np.asarray(ts, dtype=np.float64)
+		pitch_acc, roll_acc = accel_tilt(np.asarray(ac, dtype=np.float64))
+		if self.state is None:
+			self.state = np.array([pitch_acc[0], roll_acc[0], 0.0])
+			self.last_ts = ts[0]
+		dt = np.diff(np.concatenate(([self.last_ts], ts))) * 1e-6
+		rot = np.asarray(gy, dtype=np.float64) * dt[:, None]
+		out = np.zeros((len(ts), 4))
+		out[:, 0] = ts
+		for start in range(0, len(ts), self.chunk):
+			end = min(start + self.chunk, len(ts))
+			p = self.powers[:end - start]
+			for col, (axis, tilt) in enumerate(((0, pitch_acc), (2, roll_acc))):
+				b = self.a * rot[start:end, axis] + (1 - self.a) * tilt[start:end]
+				out[start:end, 1 + col] = p * (self.state[col] + np.cumsum(b / p))
+			out[start:end, 3] = self.state[2] + np.cumsum(rot[start:end, 1])
+			self.state = out[end - 1, 1:].copy()
+		self.last_ts = ts[-1]
+		self.__store__(out)
+		return out
+
+	def __store__(self, rows):
+		n = len(self.history)
+		rows = rows[-n:]
+		idx = (self.count + np.arange(len(rows))) % n
+		self.history[idx] = rows
+		self.count += len(rows)
+
+	def get_orientation(self):
+		"""Latest orientation relative to the reference, as a get_data() style entry."""
+		if self.state is None:
+			return {'ts': -1}
+		pitch, roll, yaw = self.state - self.reference
+		return {'ts': int(self.last_ts), 'pitch': pitch, 'roll': roll, 'yaw': yaw}
+
+	def set_reference(self, orientation=None):
+		"""Sets the orientation the angles are relative to (default: the current one)."""
+		if orientation is None:
+			orientation = self.state if self.state is not None else np.zeros(3)
+		self.reference = np.array(orientation, dtype=np.float64)
+
+	def orientation_at(self, ts):
+		"""(pitch, roll, yaw) relative to the reference, interpolated at the given ts."""
+		n = min(self.count, len(self.history))
+		ts = np.asarray(ts, dtype=np.float64)
+		if n == 0:
+			return np.zeros((len(ts), 3))
+		order = (self.count - n + np.arange(n)) % len(self.history)
+		rows = self.history[order]
+		return np.column_stack([np.interp(ts, rows[:, 0], rows[:, 1 + i]) - self.reference[i] for i in range(3)])
+
+	def compensate(self, ts, xy, hfov=SCENE_HFOV, vfov=SCENE_VFOV):
+		"""Maps gaze points (normalized scene coordinates) to the scene as it
+		was seen at the reference orientation, so that bounds checks and AOIs
+		stay fixed in the world while the head turns. Small angle
+		approximation, roll is ignored."""
+		xy = np.array(xy, dtype=np.float64).reshape(-1, 2)
+		angles = self.orientation_at(ts)
+		xy[:, 0] -= angles[:, 2] / hfov
+		xy[:, 1] += angles[:, 0] / vfov
+		return xy
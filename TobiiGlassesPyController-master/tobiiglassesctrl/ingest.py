@@ -0,0 +1,316 @@
+# ingest.py: Process isolated live data ingest for Tobii Pro Glasses 2
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import time
+import socket
+import struct
+import logging
+import threading
+import multiprocessing
+
+from multiprocessing import shared_memory
+
+try:
+	import numpy as np
+	NUMPY_AVAILABLE = True
+except ImportError:
+	NUMPY_AVAILABLE = False
+
+from .packets import DATA_SLOTS, SLOT_INDEX, RECORD, RECORD_SIZE, RECORD_FIELDS, \
+	packet_key, packet_slot, slot_index, encode_packet, decode_record, empty_data
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype(RECORD_FIELDS) if NUMPY_AVAILABLE else None
+
+DEFAULT_CAPACITY = 8192
+RECV_TIMEOUT = 5.0
+
+# Shared memory layout:
+#   [0, 64)        capacity, number of slots
+#   [64, ...)      one u64 write counter per slot
+#   latest table   per slot: u64 seqlock version + latest valid record
+#   rings          per slot: capacity records
+_U64 = struct.Struct('<Q')
+_HEADER = struct.Struct('<QQ')
+_COUNTERS_OFFSET = 64
+_LATEST_ENTRY_SIZE = 8 + RECORD_SIZE
+
+
+def _align(n, a=64):
+	return (n + a - 1) // a * a
+
+def ring_size(capacity, n_slots=len(DATA_SLOTS)):
+	latest = _align(_COUNTERS_OFFSET + 8 * n_slots)
+	rings = _align(latest + _LATEST_ENTRY_SIZE * n_slots)
+	return rings + n_slots * capacity * RECORD_SIZE
+
+
+class SampleRing(object):
+	"""Single producer ring buffer of decoded packets stored in shared memory.
+
+	The producer (the ingest process) calls write(); any number of readers
+	attached by name can call get_data(), get_window() and read_since()
+	without locks. Each get_data() slot has its own ring, so the window of a
+	channel is a contiguous region of memory.
+	"""
+
+	def __init__(self, capacity=DEFAULT_CAPACITY, name=None, create=False):
+		n_slots = len(DATA_SLOTS)
+		if create:
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=ring_size(capacity, n_slots))
+			_HEADER.pack_into(self.shm.buf, 0, capacity, n_slots)
+		else:
+			self.shm = _attach(name)
+			capacity, n_slots = _HEADER.unpack_from(self.shm.buf, 0)
+		self.owner = create
+		self.name = self.shm.name
+		self.capacity = capacity
+		self.n_slots = n_slots
+		self.latest_offset = _align(_COUNTERS_OFFSET + 8 * n_slots)
+		self.rings_offset = _align(self.latest_offset + _LATEST_ENTRY_SIZE * n_slots)
+		self.__latest_ts__ = [-1] * n_slots
+		self.__arrays__ = None
+
+	def __slot_record_offset__(self, slot, seq):
+		return self.rings_offset + (slot * self.capacity + seq % self.capacity) * RECORD_SIZE
+
+	def close(self):
+		self.__arrays__ = None
+		try:
+			self.shm.close()
+		except BufferError:
+			logger.warning("Shared memory %s is still referenced by a sample window", self.name)
+		if self.owner:
+			self.shm.unlink()
+			self.owner = False
+
+	def count(self, slot):
+		return _U64.unpack_from(self.shm.buf, _COUNTERS_OFFSET + 8 * slot)[0]
+
+	def write(self, jsondata):
+		key = packet_key(jsondata)
+		if key is None:
+			return False
+		slot = SLOT_INDEX.get(packet_slot(jsondata))
+		if slot is None:
+			return False
+		values = encode_packet(jsondata, key)
+		buf = self.shm.buf
+		counter = _COUNTERS_OFFSET + 8 * slot
+		seq = _U64.unpack_from(buf, counter)[0]
+		RECORD.pack_into(buf, self.__slot_record_offset__(slot, seq), *values)
+		_U64.pack_into(buf, counter, seq + 1)
+		if values[7] == 0 and self.__latest_ts__[slot] < values[0]:
+			self.__latest_ts__[slot] = values[0]
+			entry = self.latest_offset + _LATEST_ENTRY_SIZE * slot
+			version = _U64.unpack_from(buf, entry)[0]
+			_U64.pack_into(buf, entry, version + 1)
+			RECORD.pack_into(buf, entry + 8, *values)
+			_U64.pack_into(buf, entry, version + 2)
+		return True
+
+	def get_latest(self, slot):
+		buf = self.shm.buf
+		entry = self.latest_offset + _LATEST_ENTRY_SIZE * slot
+		while True:
+			version = _U64.unpack_from(buf, entry)[0]
+			if version & 1:
+				continue
+			values = RECORD.unpack_from(buf, entry + 8)
+			if _U64.unpack_from(buf, entry)[0] == version:
+				return decode_record(values)
+
+	def get_data(self):
+		data = empty_data()
+		for slot, (group, key) in enumerate(DATA_SLOTS):
+			if group is None:
+				data[key] = self.get_latest(slot)
+			else:
+				data[group][key] = self.get_latest(slot)
+		return data
+
+	def __ring_arrays__(self):
+		if not NUMPY_AVAILABLE:
+			raise ImportError("Sample windows require numpy")
+		if self.__arrays__ is None:
+			records = np.ndarray((self.n_slots, self.capacity), dtype=RECORD_DTYPE,
+								 buffer=self.shm.buf, offset=self.rings_offset)
+			self.__arrays__ = records
+		return self.__arrays__
+
+	def get_window(self, slot, n):
+		"""Returns the last n records of a slot as a numpy structured array.
+
+		If the window does not wrap around the end of the ring the result is a
+		view on the shared memory (no copy): it is valid for capacity - n more
+		writes to the same slot, the next one overwrites its oldest record (a
+		view of capacity records is stale as soon as the producer writes again).
+		"""
+		end = self.count(slot)
+		return self.get_range(slot, end - min(n, end, self.capacity), end)
+
+	def get_range(self, slot, start, end):
+		"""Returns the records of sequence numbers [start, end) of a slot, which
+		must not span more than capacity records (a view unless it wraps)."""
+		records = self.__ring_arrays__()[slot]
+		n = end - start
+		i, j = start % self.capacity, end % self.capacity
+		if n == 0 or i < j or j == 0:
+			return records[i:i + n]
+		return np.concatenate((records[i:], records[:j]))
+
+	def read_since(self, slot, seq):
+		"""Returns (records, next_seq) with the records written after seq (a copy).
+
+		Records overwritten before they could be read are skipped, including
+		the oldest one of a full ring: write() stores the next record in its
+		place before bumping the counter.
+		"""
+		# The counter is read once: the producer may keep writing while copying
+		end = self.count(slot)
+		seq = max(seq, end - self.capacity)
+		window = self.get_range(slot, seq, end).copy()
+		lost = self.count(slot) + 1 - self.capacity - seq
+		if lost > 0:
+			window = window[lost:]
+		return window, end
+
+
+def encode_records(packets):
+	"""Encodes packet dictionaries into a structured array of records."""
+	values = [encode_packet(packet) for packet in packets]
+	data = b''.join([RECORD.pack(*v) for v in values if v is not None])
+	return np.frombuffer(data, dtype=RECORD_DTYPE).copy()
+
+def decode_records(records):
+	"""Rebuilds the packet dictionaries of a structured array of records."""
+	packets = []
+	for ts, gidx, iv, v, l, s, ch, eye, pad in records.tolist():
+		packets.append(decode_record((ts, gidx, iv, v[0], v[1], v[2], l, s, ch, eye)))
+	return packets
+
+def _attach(name):
+	try:
+		return shared_memory.SharedMemory(name=name, track=False)
+	except TypeError:
+		# Python < 3.13: attaching registers the segment with the resource tracker
+		pass
+	shm = shared_memory.SharedMemory(name=name)
+	if multiprocessing.parent_process() is None:
+		# An unrelated process has its own resource tracker, which would unlink
+		# the segment when it exits (bpo-39959). The children of the creator
+		# share its tracker and must leave the registration in place, so that the
+		# segment is still removed if the creator dies.
+		from multiprocessing import resource_tracker
+		resource_tracker.unregister(shm._name, 'shared_memory')
+	return shm
+
+def _ingest_main(name, peer, iface_name, ka_msg, ka_interval, stop):
+	from .controller import mksock
+	ring = SampleRing(name=name)
+	sock = mksock(peer, iface_name)
+	# Short socket timeout so that stop requests are served promptly
+	sock.settimeout(min(ka_interval, RECV_TIMEOUT))
+
+	def keepalive():
+		while not stop.is_set():
+			sock.sendto(ka_msg.encode('utf-8'), peer)
+			stop.wait(ka_interval)
+
+	ka = threading.Thread(target=keepalive)
+	ka.daemon = True
+	ka.start()
+	try:
+		last = time.time()
+		while not stop.is_set():
+			try:
+				data, address = sock.recvfrom(1024)
+				last = time.time()
+			except socket.timeout:
+				if time.time() - last > RECV_TIMEOUT:
+					logger.error("A timeout occurred while receiving data")
+					break
+				continue
+			try:
+				ring.write(json.loads(data.decode('utf-8')))
+			except ValueError:
+				pass
+	finally:
+		stop.set()
+		ka.join()
+		sock.close()
+		ring.close()
+
+
+class ProcessIngest(object):
+	"""Receives and decodes the live data stream in a child process.
+
+	The child owns the data socket and its keep-alive messages and writes the
+	decoded packets into a SampleRing, so the receive loop does not compete
+	for the GIL with the analysis running in the parent process.
+	"""
+
+	def __init__(self, peer, iface_name, ka_msg, capacity=DEFAULT_CAPACITY, ka_interval=1):
+		self.peer = peer
+		self.iface_name = iface_name
+		self.ka_msg = ka_msg
+		self.ka_interval = ka_interval
+		self.ring = SampleRing(capacity, create=True)
+		self.stop_event = multiprocessing.Event()
+		self.process = None
+		self.cursors = [0] * self.ring.n_slots
+
+	def start(self):
+		self.stop_event.clear()
+		self.process = multiprocessing.Process(target=_ingest_main,
+											   args=(self.ring.name, self.peer, self.iface_name,
+													 self.ka_msg, self.ka_interval, self.stop_event))
+		self.process.daemon = True
+		self.process.start()
+
+	def stop(self):
+		self.stop_event.set()
+		if self.process is not None:
+			self.process.join()
+			self.process = None
+
+	def close(self):
+		self.stop()
+		self.ring.close()
+
+	def is_alive(self):
+		return self.process is not None and self.process.is_alive()
+
+	def get_data(self):
+		return self.ring.get_data()
+
+	def read_new(self):
+		"""Returns the records written since the previous call, ordered by ts."""
+		chunks = []
+		for slot in range(self.ring.n_slots):
+			records, self.cursors[slot] = self.ring.read_since(slot, self.cursors[slot])
+			if len(records) > 0:
+				chunks.append(records)
+		if not chunks:
+			return self.ring.get_window(0, 0).copy()
+		records = np.concatenate(chunks)
+		return records[np.argsort(records['ts'], kind='stable')]
+
+	def get_window(self, key, n, eye=None):
+		return self.ring.get_window(slot_index(key, eye), n)
@@ -0,0 +1,132 @@
+# metrics.py: Low overhead timers and counters of the controller hot paths
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import math
+import time
+import threading
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Bucket i counts the durations in [2**(i-1), 2**i) microseconds, the last one is +Inf
+N_BUCKETS = 28
+BUCKET_BOUNDS = [1e-6 * 2 ** i for i in range(N_BUCKETS - 1)] + [float('inf')]
+
+PREFIX = 'tobiiglassesctrl'
+
+
+class Histogram(object):
+	"""Fixed-size histogram of durations (seconds) with power of two buckets."""
+
+	def __init__(self):
+		self.buckets = [0] * N_BUCKETS
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		i = math.frexp(seconds * 1e6)[1] if seconds > 0 else 0
+		self.buckets[min(max(i, 0), N_BUCKETS - 1)] += 1
+		self.count += 1
+		self.sum += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def quantile(self, q):
+		"""Upper bound of the bucket holding the q-quantile."""
+		target = q * self.count
+		acc = 0
+		for i, n in enumerate(self.buckets):
+			acc += n
+			if n > 0 and acc >= target:
+				return min(BUCKET_BOUNDS[i], self.max)
+		return 0.0
+
+	def to_dict(self):
+		return {'count': self.count, 'sum': self.sum, 'max': self.max,
+				'mean': self.sum / self.count if self.count else 0.0,
+				'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+				'buckets': list(self.buckets)}
+
+
+class Metrics(object):
+	"""Per-stage duration histograms and counters.
+
+	Stages are identified by a name and an optional endpoint (the HTTP round
+	trips are recorded per API endpoint).
+	"""
+
+	def __init__(self):
+		self.stages = {}
+		self.counters = {}
+		self.lock = threading.Lock()
+
+	def observe(self, stage, seconds, endpoint=None):
+		key = (stage, endpoint)
+		with self.lock:
+			histogram = self.stages.get(key)
+			if histogram is None:
+				histogram = self.stages[key] = Histogram()
+			histogram.observe(seconds)
+
+	def incr(self, counter, n=1):
+		with self.lock:
+			self.counters[counter] = self.counters.get(counter, 0) + n
+
+	def observe_packet(self, recv, decode, dispatch, publish, size):
+		with self.lock:
+			for stage, seconds in (('recv', recv), ('decode', decode), ('dispatch', dispatch), ('publish', publish)):
+				histogram = self.stages.get((stage, None))
+				if histogram is None:
+					histogram = self.stages[(stage, None)] = Histogram()
+				histogram.observe(seconds)
+			self.counters['packets'] = self.counters.get('packets', 0) + 1
+			self.counters['bytes'] = self.counters.get('bytes', 0) + size
+
+	def get_metrics(self):
+		with self.lock:
+			stages = {}
+			for (stage, endpoint), histogram in self.stages.items():
+				name = stage if endpoint is None else '%s %s' % (stage, endpoint)
+				stages[name] = histogram.to_dict()
+			return {'stages': stages, 'counters': dict(self.counters)}
+
+	def to_prometheus(self):
+		lines = ['# TYPE %s_stage_seconds histogram' % PREFIX]
+		with self.lock:
+			for (stage, endpoint), h in sorted(self.stages.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+				labels = 'stage="%s"' % stage
+				if endpoint is not None:
+					labels += ',endpoint="%s"' % endpoint
+				acc = 0
+				for bound, n in zip(BUCKET_BOUNDS, h.buckets):
+					acc += n
+					le = '+Inf' if math.isinf(bound) else repr(bound)
+					lines.append('%s_stage_seconds_bucket{%s,le="%s"} %d' % (PREFIX, labels, le, acc))
+				lines.append('%s_stage_seconds_sum{%s} %r' % (PREFIX, labels, h.sum))
+				lines.append('%s_stage_seconds_count{%s} %d' % (PREFIX, labels, h.count))
+			for counter, value in sorted(self.counters.items()):
+				lines.append('# TYPE %s_%s_total counter' % (PREFIX, counter))
+				lines.append('%s_%s_total %d' % (PREFIX, counter, value))
+		return '\n'.join(lines) + '\n'
+
+
+def endpoint_name(api_action):
+	"""API path with the object ids replaced by :id, to bound the number of endpoints."""
+	parts = api_action.rstrip('/').split('/')
+	if len(parts) > 3 and parts[2] in ('projects', 'participants', 'calibrations', 'recordings'):
+		parts[3] = ':id'
+	return '/'.join(parts)
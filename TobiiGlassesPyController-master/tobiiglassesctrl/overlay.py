@@ -0,0 +1,233 @@
+# overlay.py: Offline rendering of the gaze over the scene video of recordings
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import math
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .packets import PACKET_KEYS
+
+logger = logging.getLogger(__name__)
+
+GP = PACKET_KEYS.index('gp') + 1
+PTS = PACKET_KEYS.index('pts') + 1
+VTS = PACKET_KEYS.index('vts') + 1
+# pts are in units of the 90 kHz MPEG clock
+PTS_PER_US = 0.09
+
+
+def _cv2():
+	# OpenCV is only needed to decode and encode the videos
+	import cv2
+	return cv2
+
+def sync_points(records):
+	"""(video time us, device ts) pairs from the vts packets, or the pts packets if there are none."""
+	valid = records['s'] == 0
+	vts = records[valid & (records['ch'] == VTS)]
+	if len(vts):
+		video, ts = vts['iv'].astype(np.float64), vts['ts']
+	else:
+		pts = records[valid & (records['ch'] == PTS)]
+		video, ts = pts['iv'] / PTS_PER_US, pts['ts']
+	order = np.argsort(video, kind='stable')
+	return video[order], ts[order].astype(np.float64)
+
+def frame_timestamps(records, frame_times):
+	"""Device ts of video frames given their time in the video (us).
+
+	Each frame is referred to the last sync packet preceding it (the first
+	one for the frames before it): ts = sync ts + (frame time - sync time).
+	"""
+	video, ts = sync_points(records)
+	frame_times = np.asarray(frame_times, dtype=np.float64)
+	if len(video) == 0:
+		raise ValueError("The records have no vts or pts packets to synchronize the video")
+	i = np.clip(np.searchsorted(video, frame_times, side='right') - 1, 0, len(video) - 1)
+	return (ts[i] + frame_times - video[i]).astype(np.int64)
+
+def gaze_samples(records):
+	"""ts and (x, y) of the valid gp samples, ordered by ts."""
+	gp = records[(records['ch'] == GP) & (records['s'] == 0)]
+	gp = gp[np.isfinite(gp['v'][:, 0]) & np.isfinite(gp['v'][:, 1])]
+	order = np.argsort(gp['ts'], kind='stable')
+	return gp['ts'][order], gp['v'][order, :2]
+
+def gaze_at(gp_ts, gp_xy, frame_ts, max_age=50000):
+	"""Gaze interpolated at every frame ts, NaN where no sample is within max_age us."""
+	frame_ts = np.asarray(frame_ts, dtype=np.int64)
+	out = np.full((len(frame_ts), 2), np.nan)
+	if len(gp_ts) == 0:
+		return out
+	i = np.searchsorted(gp_ts, frame_ts, side='right') - 1
+	j = np.minimum(i + 1, len(gp_ts) - 1)
+	ok = (i >= 0) & (frame_ts - gp_ts[np.maximum(i, 0)] <= max_age)
+	i = np.maximum(i, 0)
+	span = (gp_ts[j] - gp_ts[i]).astype(np.float64)
+	# Interpolate only across a gap shorter than max_age, otherwise hold the last sample
+	w = np.where((span > 0) & (span <= max_age), (frame_ts - gp_ts[i]) / np.where(span > 0, span, 1), 0.0)
+	w = np.clip(w, 0.0, 1.0)[:, None]
+	out[ok] = (gp_xy[i] * (1 - w) + gp_xy[j] * w)[ok]
+	return out
+
+def _render_segment(video_path, out_path, start, frame_ts, gp_ts, gp_xy, style):
+	"""Renders the frames [start, start + len(frame_ts)) of a video (run in the worker processes)."""
+	cv2 = _cv2()
+	t0 = time.time()
+	cap = cv2.VideoCapture(video_path)
+	cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+	fps = cap.get(cv2.CAP_PROP_FPS)
+	width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+	height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+	writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*style['fourcc']), fps, (width, height))
+	markers = gaze_at(gp_ts, gp_xy, frame_ts, style['max_age'])
+	trail_start = np.searchsorted(gp_ts, frame_ts - style['trail'])
+	trail_end = np.searchsorted(gp_ts, frame_ts, side='right')
+	scale = np.array([width, height], dtype=np.float64)
+	written = 0
+	for k in range(len(frame_ts)):
+		ok, frame = cap.read()
+		if not ok:
+			break
+		if trail_end[k] - trail_start[k] > 1:
+			points = (gp_xy[trail_start[k]:trail_end[k]] * scale).astype(np.int32)
+			cv2.polylines(frame, [points.reshape(-1, 1, 2)], False, style['trail_color'], style['trail_thickness'])
+		if not np.isnan(markers[k, 0]):
+			x, y = (markers[k] * scale).astype(int)
+			cv2.circle(frame, (int(x), int(y)), style['radius'], style['color'], style['thickness'])
+		writer.write(frame)
+		written += 1
+	writer.release()
+	cap.release()
+	return written, time.time() - t0
+
+
+class OverlayRenderer(object):
+	"""Renders the gaze of recorded records over a scene video.
+
+	Every frame gets the gaze interpolated at its own device ts (obtained
+	from the vts, or pts, sync packets) and a trail of the samples of the
+	last trail microseconds. The video is split into segments of
+	segment_frames frames rendered by a pool of worker processes, each
+	seeking to the start of its segment, and the segments are then stitched
+	(with ffmpeg stream copy when available, otherwise re-encoded with
+	OpenCV). Requires OpenCV (cv2).
+	"""
+
+	def __init__(self, workers=None, segment_frames=None, radius=30, color=(0, 0, 255), thickness=4,
+				 trail=300000, trail_color=(0, 255, 255), trail_thickness=2, max_age=50000, fourcc='mp4v'):
+		self.workers = os.cpu_count() if workers is None else workers
+		self.segment_frames = segment_frames
+		self.style = {'radius': radius, 'color': color, 'thickness': thickness, 'trail': trail,
+					  'trail_color': trail_color, 'trail_thickness': trail_thickness,
+					  'max_age': max_age, 'fourcc': fourcc}
+
+	def render(self, video_path, records, output_path):
+		"""Renders video_path with the gaze of records into output_path, returns the timings."""
+		cv2 = _cv2()
+		t0 = time.time()
+		cap = cv2.VideoCapture(video_path)
+		if not cap.isOpened():
+			raise IOError("Cannot open the video %s" % video_path)
+		fps = cap.get(cv2.CAP_PROP_FPS)
+		n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+		cap.release()
+		if n <= 0 or fps <= 0:
+			raise IOError("Cannot read the frames of the video %s" % video_path)
+		frame_ts = frame_timestamps(records, np.arange(n) * (1e6 / fps))
+		gp_ts, gp_xy = gaze_samples(records)
+		workers = max(self.workers, 1)
+		size = self.segment_frames or max(int(math.ceil(n / float(2 * workers))), 1)
+		tmpdir = tempfile.mkdtemp(prefix='overlay')
+		segments = []
+		try:
+			jobs = []
+			for start in range(0, n, size):
+				ts = frame_ts[start:start + size]
+				# Only the gaze samples of the segment (and of the trail before it) are sent to the worker
+				lo = np.searchsorted(gp_ts, ts[0] - max(self.style['trail'], self.style['max_age']))
+				hi = np.searchsorted(gp_ts, ts[-1], side='right') + 1
+				path = os.path.join(tmpdir, '%06d%s' % (start, os.path.splitext(output_path)[1] or '.mp4'))
+				segments.append(path)
+				jobs.append((video_path, path, start, ts, gp_ts[lo:hi], gp_xy[lo:hi], self.style))
+			if self.workers == 0:
+				results = [_render_segment(*job) for job in jobs]
+			else:
+				with ProcessPoolExecutor(max_workers=workers) as pool:
+					results = list(pool.map(_render_segment, *zip(*jobs)))
+			rendered = time.time()
+			self.__stitch__(segments, output_path, fps)
+		finally:
+			shutil.rmtree(tmpdir, ignore_errors=True)
+		frames = sum(r[0] for r in results)
+		elapsed = time.time() - t0
+		stats = {'frames': frames, 'segments': len(segments), 'seconds': elapsed,
+				 'fps': frames / elapsed if elapsed > 0 else 0.0,
+				 'render_seconds': rendered - t0, 'stitch_seconds': time.time() - rendered,
+				 'worker_fps': [r[0] / r[1] if r[1] > 0 else 0.0 for r in results]}
+		logger.info("Rendered %d frames of %s in %.1f s (%.1f fps)", frames, video_path, elapsed, stats['fps'])
+		return stats
+
+	def __stitch__(self, segments, output_path, fps):
+		ffmpeg = shutil.which('ffmpeg')
+		if ffmpeg is not None:
+			listing = os.path.join(os.path.dirname(segments[0]), 'segments.txt')
+			with open(listing, 'w') as f:
+				for path in segments:
+					f.write("file '%s'\n" % path)
+			subprocess.check_call([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+								   '-i', listing, '-c', 'copy', output_path])
+			return
+		cv2 = _cv2()
+		writer = None
+		for path in segments:
+			cap = cv2.VideoCapture(path)
+			while True:
+				ok, frame = cap.read()
+				if not ok:
+					break
+				if writer is None:
+					height, width = frame.shape[:2]
+					writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*self.style['fourcc']), fps, (width, height))
+				writer.write(frame)
+			cap.release()
+		if writer is not None:
+			writer.release()
+
+
+def render_recording(path, output_dir, **kwargs):
+	"""Renders every segment of an SD card recording, returns their timings."""
+	from .recording import RecordingReader, recording_files
+	renderer = OverlayRenderer(**kwargs)
+	files = recording_files(path)
+	stats = []
+	for kind, livedata in files:
+		video = os.path.join(os.path.dirname(livedata), 'fullstream.mp4')
+		if kind != 'livedata' or not os.path.isfile(video):
+			continue
+		with RecordingReader(livedata, workers=renderer.workers) as reader:
+			records = reader.read(keys=['gp', 'pts', 'vts'])
+		segment = os.path.basename(os.path.dirname(livedata))
+		stats.append(renderer.render(video, records, os.path.join(output_dir, 'overlay_%s.mp4' % segment)))
+	return stats
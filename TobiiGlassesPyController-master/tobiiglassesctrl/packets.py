@@ -0,0 +1,184 @@
+# packets.py: Live data packet schema for Tobii Pro Glasses 2
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import math
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Keys identifying the channel of a live data packet. A packet carries exactly
+# one of them; 'pts' packets also carry 'pv', so 'pts' must be tested first.
+PACKET_KEYS = ('ac', 'gy', 'pc', 'pd', 'gd', 'gp', 'gp3', 'pts', 'vts')
+MEMS_KEYS = ('ac', 'gy')
+EYE_KEYS = ('pc', 'pd', 'gd')
+EYES = ('left', 'right')
+
+# Number of float components stored for each channel
+PACKET_WIDTH = {'ac': 3, 'gy': 3, 'pc': 3, 'pd': 1, 'gd': 3, 'gp': 2, 'gp3': 3, 'pts': 0, 'vts': 0}
+
+# The (group, key) pairs of the dictionary returned by get_data(), group is None
+# for the top level entries.
+DATA_SLOTS = (('mems', 'ac'), ('mems', 'gy'),
+			  ('left_eye', 'pc'), ('left_eye', 'pd'), ('left_eye', 'gd'),
+			  ('right_eye', 'pc'), ('right_eye', 'pd'), ('right_eye', 'gd'),
+			  (None, 'gp'), (None, 'gp3'), (None, 'pts'), (None, 'vts'))
+
+SLOT_INDEX = dict((slot, i) for i, slot in enumerate(DATA_SLOTS))
+
+# Fixed size binary record of a decoded packet (64 bytes):
+# ts, gidx, iv (pts/vts), v[3], l (gp latency), s, channel, eye
+RECORD = struct.Struct('<qqq3ddiBB2x')
+RECORD_SIZE = RECORD.size
+RECORD_FIELDS = [('ts', '<i8'), ('gidx', '<i8'), ('iv', '<i8'), ('v', '<f8', (3,)),
+				 ('l', '<f8'), ('s', '<i4'), ('ch', 'u1'), ('eye', 'u1'), ('pad', 'V2')]
+
+NAN = float('nan')
+
+
+def empty_data():
+	nd = {'ts': -1}
+	data = {}
+	data['mems'] = { 'ac': nd, 'gy': nd }
+	data['right_eye'] = { 'pc': nd, 'pd': nd, 'gd': nd}
+	data['left_eye'] = { 'pc': nd, 'pd': nd, 'gd': nd}
+	data['gp'] = nd
+	data['gp3'] = nd
+	data['pts'] = nd
+	data['vts'] = nd
+	return data
+
+def packet_key(jsondata):
+	for key in PACKET_KEYS:
+		if key in jsondata:
+			return key
+	return None
+
+def packet_slot(jsondata):
+	"""Returns the (group, key) entry of get_data() the packet belongs to, or None."""
+	key = packet_key(jsondata)
+	if key is None:
+		return None
+	if key in EYE_KEYS:
+		eye = jsondata.get('eye')
+		if eye not in EYES:
+			return None
+		return (eye + '_eye', key)
+	if key in MEMS_KEYS:
+		return ('mems', key)
+	return (None, key)
+
+def refresh_data(data, jsondata):
+	"""Stores a valid packet in its entry of data (see empty_data()) if it is newer."""
+	slot = packet_slot(jsondata)
+	if slot is None:
+		return
+	group, key = slot
+	entries = data if group is None else data[group]
+	if entries[key]['ts'] < jsondata['ts'] and jsondata['s'] == 0:
+		entries[key] = jsondata
+
+def notify_listeners(listeners, jsondata):
+	for listener in listeners:
+		try:
+			listener(jsondata)
+		except Exception as e:
+			logger.error("Data listener %s failed: %s", listener, e)
+
+def slot_index(key, eye=None):
+	if key in EYE_KEYS:
+		return SLOT_INDEX[(eye + '_eye', key)]
+	if key in MEMS_KEYS:
+		return SLOT_INDEX[('mems', key)]
+	return SLOT_INDEX[(None, key)]
+
+def encode_packet(jsondata, key=None):
+	"""Returns the RECORD values of a packet, or None if it is not a data packet."""
+	if key is None:
+		key = packet_key(jsondata)
+		if key is None:
+			return None
+	v0 = v1 = v2 = NAN
+	iv = 0
+	value = jsondata.get(key)
+	if key == 'pts' or key == 'vts':
+		iv = int(value or 0)
+		if key == 'pts' and 'pv' in jsondata:
+			v0 = float(jsondata['pv'])
+	elif key == 'pd':
+		if value is not None:
+			v0 = float(value)
+	elif value is not None:
+		n = len(value)
+		if n > 0:
+			v0 = float(value[0])
+		if n > 1:
+			v1 = float(value[1])
+		if n > 2:
+			v2 = float(value[2])
+	eye = jsondata.get('eye')
+	return (int(jsondata.get('ts', -1)), int(jsondata.get('gidx', -1)), iv,
+			v0, v1, v2, float(jsondata.get('l', NAN)), int(jsondata.get('s', -1)),
+			PACKET_KEYS.index(key) + 1, EYES.index(eye) + 1 if eye in EYES else 0)
+
+def decode_record(values):
+	"""Rebuilds the packet dictionary from RECORD values."""
+	ts, gidx, iv, v0, v1, v2, l, s, ch, eye = values
+	if ch == 0:
+		return {'ts': -1}
+	key = PACKET_KEYS[ch - 1]
+	data = {'ts': ts, 's': s}
+	if gidx >= 0:
+		data['gidx'] = gidx
+	if eye > 0:
+		data['eye'] = EYES[eye - 1]
+	if key == 'pts' or key == 'vts':
+		data[key] = iv
+		if key == 'pts' and not math.isnan(v0):
+			data['pv'] = int(v0)
+	elif key == 'pd':
+		data[key] = v0
+	else:
+		data[key] = [v0, v1, v2][:PACKET_WIDTH[key]]
+	if not math.isnan(l):
+		data['l'] = l
+	return data
+
+
+class GazeBuffer(object):
+	"""Base of the data listeners processing the valid gp samples in batches.
+
+	push() can be registered with TobiiGlassesController.add_data_listener:
+	it buffers (ts, x, y) from the streaming thread, and the subclasses take
+	the buffered samples with pop_pending() when they update.
+	"""
+
+	def __init__(self):
+		self.pending = []
+		self.pending_lock = threading.Lock()
+
+	def push(self, packet):
+		if 'gp' in packet and packet.get('s') == 0:
+			with self.pending_lock:
+				self.pending.append((packet['ts'], packet['gp'][0], packet['gp'][1]))
+
+	def pop_pending(self):
+		"""Returns and clears the buffered (ts, x, y) samples."""
+		with self.pending_lock:
+			pending, self.pending = self.pending, []
+		return pending
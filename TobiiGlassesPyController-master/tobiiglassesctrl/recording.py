@@ -0,0 +1,260 @@
+# recording.py: Reader of the recordings stored on the SD card
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import re
+import json
+import zlib
+import bisect
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .packets import RECORD, PACKET_KEYS, encode_packet
+from .ingest import RECORD_DTYPE, decode_records
+
+logger = logging.getLogger(__name__)
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+READ_SIZE = 256 * 1024
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_CHECKPOINT_INTERVAL = 16 * 1024 * 1024
+
+_TS = re.compile(br'"ts":\s*(-?\d+)')
+
+
+def parse_block(block):
+	"""Parses a block of JSON lines into RECORD bytes (run in the worker processes)."""
+	out = []
+	for line in block.splitlines():
+		if not line:
+			continue
+		try:
+			values = encode_packet(json.loads(line.decode('utf-8')))
+		except ValueError:
+			continue
+		if values is not None:
+			out.append(RECORD.pack(*values))
+	return b''.join(out)
+
+def segment_key(name):
+	"""Sort key of the segment directories: numeric names in order, then the others."""
+	return (not name.isdigit(), int(name) if name.isdigit() else 0, name)
+
+def recording_files(path):
+	"""The (kind, path) data files of a recording directory ('livedata' and 'video'), ordered by segment."""
+	files = []
+	segments_dir = os.path.join(path, 'segments')
+	if os.path.isdir(segments_dir):
+		for name in sorted(os.listdir(segments_dir), key=segment_key):
+			for kind, filename in (('livedata', 'livedata.json.gz'), ('video', 'fullstream.mp4')):
+				filename = os.path.join(segments_dir, name, filename)
+				if os.path.isfile(filename):
+					files.append((kind, filename))
+	return files
+
+def recording_segments(path):
+	"""Returns the livedata files of a recording directory ordered by segment."""
+	if os.path.isfile(path):
+		return [path]
+	return [filename for kind, filename in recording_files(path) if kind == 'livedata']
+
+def _inflate(d, raw):
+	out = [d.decompress(raw)]
+	# Concatenated gzip members
+	while d.eof and d.unused_data.strip(b'\0'):
+		rest = d.unused_data
+		d = zlib.decompressobj(GZIP_WBITS)
+		out.append(d.decompress(rest))
+	return d, b''.join(out)
+
+
+class LivedataFile(object):
+	"""Seekable reader of a gzipped JSON-lines livedata file.
+
+	build_index() decompresses the file once, splitting it into line-aligned
+	blocks of about block_size bytes whose ts range is recorded, and keeps a
+	copy of the decompressor state every checkpoint_interval bytes. Time
+	range queries then decompress only from the checkpoint preceding the
+	first matching block, and only the matching blocks are parsed.
+	"""
+
+	def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
+		self.path = path
+		self.block_size = block_size
+		self.checkpoint_interval = checkpoint_interval
+		self.blocks = []
+		self.checkpoints = []
+		self.f = open(path, 'rb')
+
+	def close(self):
+		self.f.close()
+
+	def build_index(self):
+		if self.blocks:
+			return
+		self.checkpoints = [(0, 0, zlib.decompressobj(GZIP_WBITS))]
+		self.blocks = []
+		for start, block in self.__blocks__(record_checkpoints=True):
+			ts = [int(t) for t in _TS.findall(block)]
+			if ts:
+				self.blocks.append((start, len(block), min(ts), max(ts)))
+		logger.debug("Indexed %s: %d blocks, %d checkpoints", self.path, len(self.blocks), len(self.checkpoints))
+
+	def __stream__(self, offset, record_checkpoints=False):
+		"""Yields (uncompressed offset, data) from offset to the end of the file."""
+		i = bisect.bisect_right([cp[0] for cp in self.checkpoints], offset) - 1
+		pos, file_pos, d = self.checkpoints[i]
+		d = d.copy()
+		self.f.seek(file_pos)
+		last_checkpoint = pos
+		while True:
+			if record_checkpoints and pos - last_checkpoint >= self.checkpoint_interval:
+				self.checkpoints.append((pos, self.f.tell(), d.copy()))
+				last_checkpoint = pos
+			raw = self.f.read(READ_SIZE)
+			if not raw:
+				break
+			d, out = _inflate(d, raw)
+			if pos + len(out) > offset:
+				skip = max(offset - pos, 0)
+				yield pos + skip, out[skip:]
+			pos += len(out)
+
+	def __blocks__(self, offset=0, record_checkpoints=False):
+		"""Yields (offset, block) line-aligned blocks starting at offset."""
+		buf = b''
+		start = offset
+		for pos, data in self.__stream__(offset, record_checkpoints):
+			buf += data
+			if len(buf) >= self.block_size:
+				cut = buf.rfind(b'\n') + 1
+				if cut > 0:
+					yield start, buf[:cut]
+					start += cut
+					buf = buf[cut:]
+		if buf:
+			yield start, buf
+
+	def iter_blocks(self, start_ts=None, end_ts=None):
+		"""Yields the raw blocks whose ts range intersects [start_ts, end_ts]."""
+		self.build_index()
+		selected = [b for b in self.blocks
+					if (start_ts is None or b[3] >= start_ts) and (end_ts is None or b[2] <= end_ts)]
+		i = 0
+		while i < len(selected):
+			# Runs of consecutive blocks are decompressed in a single pass
+			j = i
+			while j + 1 < len(selected) and selected[j + 1][0] == selected[j][0] + selected[j][1]:
+				j += 1
+			buf = b''
+			k = i
+			for offset, data in self.__stream__(selected[i][0]):
+				buf += data
+				while k <= j and len(buf) >= selected[k][1]:
+					yield buf[:selected[k][1]]
+					buf = buf[selected[k][1]:]
+					k += 1
+				if k > j:
+					break
+			i = j + 1
+
+
+class RecordingReader(object):
+	"""Parses the livedata of a recording (or of a single livedata.json.gz).
+
+	The decompression runs in the calling process while the JSON parsing of
+	the blocks is spread over a pool of worker processes (workers=0 parses
+	inline). At most 2 * workers blocks are in flight, so memory is bounded
+	by the block size whatever the length of the recording. The records use
+	the binary layout of the live ingest (see packets.RECORD).
+	"""
+
+	def __init__(self, path, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+		self.files = [LivedataFile(p, block_size) for p in recording_segments(path)]
+		self.workers = os.cpu_count() if workers is None else workers
+		self.pool = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
+		for f in self.files:
+			f.close()
+
+	def build_index(self):
+		for f in self.files:
+			f.build_index()
+
+	def get_ts_range(self):
+		self.build_index()
+		blocks = [b for f in self.files for b in f.blocks]
+		if not blocks:
+			return None
+		return min(b[2] for b in blocks), max(b[3] for b in blocks)
+
+	def __parsed__(self, start_ts, end_ts):
+		blocks = (block for f in self.files for block in f.iter_blocks(start_ts, end_ts))
+		if self.workers == 0:
+			for block in blocks:
+				yield parse_block(block)
+			return
+		if self.pool is None:
+			self.pool = ProcessPoolExecutor(max_workers=self.workers)
+		pending = deque()
+		for block in blocks:
+			pending.append(self.pool.submit(parse_block, block))
+			if len(pending) >= 2 * self.workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+	def iter_records(self, start_ts=None, end_ts=None, keys=None):
+		"""Yields record arrays of the packets with start_ts <= ts <= end_ts, block by block."""
+		channels = None if keys is None else [PACKET_KEYS.index(key) + 1 for key in keys]
+		for data in self.__parsed__(start_ts, end_ts):
+			records = np.frombuffer(data, dtype=RECORD_DTYPE)
+			mask = np.ones(len(records), dtype=bool)
+			if start_ts is not None:
+				mask &= records['ts'] >= start_ts
+			if end_ts is not None:
+				mask &= records['ts'] <= end_ts
+			if channels is not None:
+				mask &= np.isin(records['ch'], channels)
+			if mask.any():
+				yield records[mask]
+
+	def read(self, start_ts=None, end_ts=None, keys=None):
+		"""Returns all the records of a time range as a single array."""
+		chunks = list(self.iter_records(start_ts, end_ts, keys))
+		if not chunks:
+			return np.zeros(0, dtype=RECORD_DTYPE)
+		return np.concatenate(chunks)
+
+	def iter_packets(self, start_ts=None, end_ts=None, keys=None):
+		"""Yields the packets as the dictionaries received from the live stream."""
+		for records in self.iter_records(start_ts, end_ts, keys):
+			for packet in decode_records(records):
+				yield packet
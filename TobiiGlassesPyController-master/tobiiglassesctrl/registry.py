@@ -0,0 +1,120 @@
+# registry.py: Local index of the projects, participants, calibrations and recordings
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# collection: (id key, info key holding the Name, parent key)
+COLLECTIONS = {'projects': ('pr_id', 'pr_info', None),
+			   'participants': ('pa_id', 'pa_info', 'pa_project'),
+			   'calibrations': ('ca_id', None, 'ca_participant'),
+			   'recordings': ('rec_id', 'rec_info', 'rec_participant')}
+
+
+class Index(object):
+	"""Objects of one collection indexed by id, by name and by parent id."""
+
+	def __init__(self, id_key, info_key, parent_key):
+		self.id_key = id_key
+		self.info_key = info_key
+		self.parent_key = parent_key
+		self.clear()
+
+	def clear(self):
+		self.by_id = {}
+		self.by_name = {}
+		self.by_parent = {}
+
+	def add(self, obj):
+		try:
+			object_id = obj[self.id_key]
+		except (KeyError, TypeError):
+			return None
+		self.by_id[object_id] = obj
+		if self.info_key is not None:
+			try:
+				# As the linear scans it replaces, the last object with a given name wins
+				self.by_name[obj[self.info_key]['Name']] = object_id
+			except (KeyError, TypeError):
+				pass
+		if self.parent_key is not None and obj.get(self.parent_key) is not None:
+			children = self.by_parent.setdefault(obj[self.parent_key], [])
+			if object_id not in children:
+				children.append(object_id)
+		return object_id
+
+	def update(self, objects):
+		self.clear()
+		for obj in objects:
+			self.add(obj)
+
+
+class DeviceRegistry(object):
+	"""Index of the objects stored on the device, for O(1) lookups.
+
+	A collection is downloaded on its first lookup and kept up to date with
+	the objects created through the controller; refresh() downloads it again,
+	which also happens on lookup once it is older than max_age seconds (never
+	if max_age is None).
+	"""
+
+	def __init__(self, controller, max_age=None):
+		self.controller = controller
+		self.max_age = max_age
+		self.indexes = dict((name, Index(*keys)) for name, keys in COLLECTIONS.items())
+		self.refreshed = dict((name, None) for name in COLLECTIONS)
+		self.lock = threading.RLock()
+
+	def __ensure__(self, collection):
+		refreshed = self.refreshed[collection]
+		if refreshed is None or (self.max_age is not None and time.time() - refreshed > self.max_age):
+			self.refresh(collection)
+		return self.indexes[collection]
+
+	def refresh(self, collection=None):
+		collections = COLLECTIONS if collection is None else [collection]
+		for name in collections:
+			self.update(name, self.controller.__get_request__('/api/' + name))
+
+	def update(self, collection, objects):
+		"""Replaces the index of a collection with a full listing from the device."""
+		with self.lock:
+			self.indexes[collection].update(objects)
+			self.refreshed[collection] = time.time()
+		logger.debug("Registry of %s refreshed (%d objects)", collection, len(self.indexes[collection].by_id))
+
+	def add(self, collection, obj):
+		with self.lock:
+			return self.indexes[collection].add(obj)
+
+	def get(self, collection, object_id):
+		with self.lock:
+			return self.__ensure__(collection).by_id.get(object_id)
+
+	def find(self, collection, name):
+		"""Returns the id of the object with the given Name, or None."""
+		with self.lock:
+			return self.__ensure__(collection).by_name.get(name)
+
+	def children(self, collection, parent_id):
+		"""Returns the objects of a collection belonging to a project or participant."""
+		with self.lock:
+			index = self.__ensure__(collection)
+			return [index.by_id[i] for i in index.by_parent.get(parent_id, [])]
@@ -0,0 +1,161 @@
+# resample.py: Fixed-rate resampling and binocular fusion of the live data
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import threading
+
+import numpy as np
+
+from .packets import PACKET_KEYS, EYES
+from .ingest import RECORD_DTYPE, encode_records
+
+FUSED_DTYPE = np.dtype([('ts', '<i8'),
+						('gp', '<f8', (2,)), ('gp3', '<f8', (3,)),
+						('left_pc', '<f8', (3,)), ('left_pd', '<f8'), ('left_gd', '<f8', (3,)),
+						('right_pc', '<f8', (3,)), ('right_pd', '<f8'), ('right_gd', '<f8', (3,)),
+						('pc', '<f8', (3,)), ('pd', '<f8'), ('gd', '<f8', (3,)),
+						('gp_valid', '?'), ('gp3_valid', '?'), ('left_valid', '?'), ('right_valid', '?')])
+
+# (output field, packet key, eye, number of components)
+CHANNELS = (('gp', 'gp', None, 2), ('gp3', 'gp3', None, 3),
+			('left_pc', 'pc', 'left', 3), ('left_pd', 'pd', 'left', 1), ('left_gd', 'gd', 'left', 3),
+			('right_pc', 'pc', 'right', 3), ('right_pd', 'pd', 'right', 1), ('right_gd', 'gd', 'right', 3))
+
+
+def align_ts(records):
+	"""Returns the timestamps of the records, with the packets sharing a gidx
+	moved to the earliest ts of their gaze sample."""
+	ts = records['ts'].copy()
+	gidx = records['gidx']
+	has = gidx >= 0
+	if has.any():
+		groups, inverse = np.unique(gidx[has], return_inverse=True)
+		ref = np.full(len(groups), np.iinfo(np.int64).max, dtype=np.int64)
+		np.minimum.at(ref, inverse, ts[has])
+		ts[has] = ref[inverse]
+	return ts
+
+def interpolate(grid, t, values, max_gap):
+	"""Linear interpolation of values (n, k) sampled at t over grid.
+
+	A grid point is valid if it matches a sample or lies between two samples
+	at most max_gap apart; invalid points are NaN.
+	"""
+	out = np.full((len(grid), values.shape[1]), np.nan)
+	n = len(t)
+	if n == 0:
+		return out, np.zeros(len(grid), dtype=bool)
+	idx = np.searchsorted(t, grid, side='right')
+	lo = np.clip(idx - 1, 0, n - 1)
+	hi = np.clip(idx, 0, n - 1)
+	valid = (idx > 0) & ((t[lo] == grid) | ((idx < n) & (t[hi] - t[lo] <= max_gap)))
+	for j in range(values.shape[1]):
+		out[:, j] = np.interp(grid, t, values[:, j])
+	out[~valid] = np.nan
+	return out, valid
+
+def _fuse(left, right, wl, wr):
+	w = wl + wr
+	with np.errstate(invalid='ignore', divide='ignore'):
+		if left.ndim == 1:
+			return (np.nan_to_num(left) * wl + np.nan_to_num(right) * wr) / w
+		return (np.nan_to_num(left) * wl[:, None] + np.nan_to_num(right) * wr[:, None]) / w[:, None]
+
+
+class GazeResampler(object):
+	"""Aligns the gaze channels and resamples them to a fixed rate.
+
+	Packets are pushed as they arrive (push() can be registered with
+	TobiiGlassesController.add_data_listener) or as record arrays
+	(push_records()); pull() returns the dense FUSED_DTYPE block of the
+	output samples that became available since the previous call. Packets of
+	the same gaze sample (gidx) share the timestamp of the earliest of them.
+	Output samples are produced up to the newest timestamp minus delay
+	(microseconds) to wait for late channels; gaps longer than max_gap are
+	not interpolated and flagged as invalid. The left and right eye are fused
+	into pc/pd/gd by averaging the valid eyes.
+	"""
+
+	def __init__(self, rate=100, max_gap=25000, delay=20000):
+		self.period = 1e6 / rate
+		self.max_gap = max_gap
+		self.delay = delay
+		self.t0 = None
+		self.k = 0
+		self.history = np.zeros(0, dtype=RECORD_DTYPE)
+		self.pending = []
+		self.pending_records = []
+		self.lock = threading.Lock()
+
+	def push(self, packet):
+		with self.lock:
+			self.pending.append(packet)
+
+	def push_records(self, records):
+		with self.lock:
+			self.pending_records.append(records)
+
+	def pull(self):
+		with self.lock:
+			pending, self.pending = self.pending, []
+			pending_records, self.pending_records = self.pending_records, []
+		chunks = [self.history] + pending_records
+		if pending:
+			chunks.append(encode_records(pending))
+		records = np.concatenate(chunks)
+		if len(records) == 0:
+			return np.zeros(0, dtype=FUSED_DTYPE)
+		ts = align_ts(records)
+		order = np.argsort(ts, kind='stable')
+		records, ts = records[order], ts[order]
+		if self.t0 is None:
+			self.t0 = ts[0]
+		n = int(np.floor((ts[-1] - self.delay - self.t0) / self.period)) + 1 - self.k
+		if n <= 0:
+			self.history = records
+			return np.zeros(0, dtype=FUSED_DTYPE)
+		grid = self.t0 + self.period * (self.k + np.arange(n))
+		block = self.__resample__(records, ts, grid)
+		self.k += n
+		self.history = records[ts >= self.t0 + self.period * self.k - self.max_gap]
+		return block
+
+	def __resample__(self, records, ts, grid):
+		block = np.zeros(len(grid), dtype=FUSED_DTYPE)
+		block['ts'] = np.round(grid).astype(np.int64)
+		ch = records['ch']
+		eye = records['eye']
+		ok = records['s'] == 0
+		valid = {}
+		for field, key, eye_name, width in CHANNELS:
+			mask = ok & (ch == PACKET_KEYS.index(key) + 1)
+			mask &= eye == (EYES.index(eye_name) + 1 if eye_name else 0)
+			values = records['v'][mask, :width]
+			finite = np.isfinite(values).all(axis=1)
+			values, valid[field] = interpolate(grid, ts[mask][finite].astype(np.float64), values[finite], self.max_gap)
+			block[field] = values[:, 0] if width == 1 else values
+		block['gp_valid'] = valid['gp']
+		block['gp3_valid'] = valid['gp3']
+		for eye_name in EYES:
+			block[eye_name + '_valid'] = valid[eye_name + '_pc'] & valid[eye_name + '_pd'] & valid[eye_name + '_gd']
+		wl = block['left_valid'].astype(np.float64)
+		wr = block['right_valid'].astype(np.float64)
+		block['pc'] = _fuse(block['left_pc'], block['right_pc'], wl, wr)
+		block['pd'] = _fuse(block['left_pd'], block['right_pd'], wl, wr)
+		gd = _fuse(block['left_gd'], block['right_gd'], wl, wr)
+		with np.errstate(invalid='ignore', divide='ignore'):
+			block['gd'] = gd / np.linalg.norm(gd, axis=1)[:, None]
+		return block
@@ -0,0 +1,228 @@
+# stats.py: Incremental online statistics of the live data
+#
+# Copyright (C) 2019  Davide De Tommaso
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import math
+import threading
+from collections import deque
+
+from .packets import packet_key
+
+# Value ranges of the percentile sketches
+SKETCH_RANGES = {'pd': (0.0, 10.0), 'gp': (-0.5, 1.5), 'gp3': (-2000.0, 2000.0),
+				 'pc': (-100.0, 100.0), 'gd': (-1.0, 1.0), 'ac': (-20.0, 20.0), 'gy': (-500.0, 500.0)}
+
+DEFAULT_CHANNELS = (('pd', 'left'), ('pd', 'right'), ('gp', None))
+
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+
+class HistogramSketch(object):
+	"""Fixed-bin histogram supporting weighted insertions and removals.
+
+	Quantile queries cost O(bins) whatever the number of samples seen;
+	values outside [lo, hi) are counted in the first or last bin.
+	"""
+
+	def __init__(self, lo, hi, bins=256):
+		self.lo = lo
+		self.width = (hi - lo) / float(bins)
+		self.counts = [0.0] * bins
+		self.total = 0.0
+
+	def __bin__(self, x):
+		i = int((x - self.lo) / self.width)
+		return min(max(i, 0), len(self.counts) - 1)
+
+	def add(self, x, weight=1.0):
+		self.counts[self.__bin__(x)] += weight
+		self.total += weight
+
+	def remove(self, x, weight=1.0):
+		self.add(x, -weight)
+
+	def scale(self, factor):
+		self.counts = [c * factor for c in self.counts]
+		self.total *= factor
+
+	def quantile(self, q):
+		if self.total <= 0:
+			return float('nan')
+		target = q * self.total
+		acc = 0.0
+		for i, c in enumerate(self.counts):
+			if acc + c >= target and c > 0:
+				return self.lo + self.width * (i + (target - acc) / c)
+			acc += c
+		return self.lo + self.width * len(self.counts)
+
+
+class WindowStats(object):
+	"""Mean, variance, min, max and percentiles over the last window values.
+
+	Every update is O(1) (amortized for min/max), memory is O(window).
+	"""
+
+	def __init__(self, window, lo, hi, bins=256):
+		self.window = window
+		self.values = deque()
+		self.mins = deque()
+		self.maxs = deque()
+		self.n = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+		self.seq = 0
+		self.sketch = HistogramSketch(lo, hi, bins)
+
+	def add(self, x):
+		if len(self.values) == self.window:
+			self.__remove_oldest__()
+		self.values.append(x)
+		self.n += 1
+		d = x - self.mean
+		self.mean += d / self.n
+		self.m2 += d * (x - self.mean)
+		while self.mins and self.mins[-1][1] >= x:
+			self.mins.pop()
+		self.mins.append((self.seq, x))
+		while self.maxs and self.maxs[-1][1] <= x:
+			self.maxs.pop()
+		self.maxs.append((self.seq, x))
+		self.seq += 1
+		self.sketch.add(x)
+
+	def __remove_oldest__(self):
+		x = self.values.popleft()
+		oldest = self.seq - self.window
+		if self.mins[0][0] == oldest:
+			self.mins.popleft()
+		if self.maxs[0][0] == oldest:
+			self.maxs.popleft()
+		self.n -= 1
+		if self.n == 0:
+			self.mean = self.m2 = 0.0
+		else:
+			d = x - self.mean
+			self.mean -= d / self.n
+			self.m2 = max(self.m2 - d * (x - self.mean), 0.0)
+		self.sketch.remove(x)
+
+	def get_stats(self, percentiles=DEFAULT_PERCENTILES):
+		if self.n == 0:
+			return {'n': 0}
+		stats = {'n': self.n, 'mean': self.mean, 'var': self.m2 / self.n,
+				 'min': self.mins[0][1], 'max': self.maxs[0][1]}
+		for p in percentiles:
+			stats['p%d' % p] = self.sketch.quantile(p / 100.0)
+		return stats
+
+
+class DecayedStats(object):
+	"""Exponentially decayed mean, variance and percentiles.
+
+	The weight of a sample halves every half_life seconds of device time.
+	"""
+
+	def __init__(self, half_life, lo, hi, bins=256):
+		self.rate = math.log(2) / (half_life * 1e6)
+		self.ts = None
+		self.weight = 0.0
+		self.mean = 0.0
+		self.var = 0.0
+		self.sketch = HistogramSketch(lo, hi, bins)
+		self.sketch_decay = 1.0
+
+	def add(self, x, ts):
+		if self.ts is not None and ts > self.ts:
+			decay = math.exp(-self.rate * (ts - self.ts))
+			self.weight *= decay
+			# Rescaling the sketch is O(bins): do it lazily by growing the weight of new samples
+			self.sketch_decay *= decay
+			if self.sketch_decay < 1e-100:
+				self.sketch.scale(self.sketch_decay)
+				self.sketch_decay = 1.0
+		if self.ts is None or ts > self.ts:
+			self.ts = ts
+		self.weight += 1.0
+		a = 1.0 / self.weight
+		d = x - self.mean
+		self.mean += a * d
+		self.var = (1.0 - a) * (self.var + a * d * d)
+		self.sketch.add(x, 1.0 / self.sketch_decay)
+
+	def get_stats(self, percentiles=DEFAULT_PERCENTILES):
+		if self.weight == 0:
+			return {'weight': 0.0}
+		stats = {'weight': self.weight, 'mean': self.mean, 'var': self.var}
+		for p in percentiles:
+			stats['p%d' % p] = self.sketch.quantile(p / 100.0)
+		return stats
+
+
+class ChannelStats(object):
+
+	def __init__(self, key, width, window, half_life, bins):
+		lo, hi = SKETCH_RANGES[key]
+		self.window = [WindowStats(window, lo, hi, bins) for i in range(width)]
+		self.decayed = [DecayedStats(half_life, lo, hi, bins) for i in range(width)]
+
+	def add(self, values, ts):
+		for i, x in enumerate(values):
+			self.window[i].add(x)
+			self.decayed[i].add(x, ts)
+
+
+class OnlineStatistics(object):
+	"""Sliding-window and exponentially decayed statistics of the live data.
+
+	push() can be registered with TobiiGlassesController.add_data_listener;
+	only valid samples (s == 0) of the tracked (key, eye) channels are used.
+	window is a number of samples, half_life is in seconds. Queries never
+	rescan the history and memory does not grow with the session length.
+	"""
+
+	def __init__(self, channels=DEFAULT_CHANNELS, window=500, half_life=5.0, bins=256):
+		self.channels = {}
+		for key, eye in channels:
+			width = 1 if key == 'pd' else (2 if key == 'gp' else 3)
+			self.channels[(key, eye)] = ChannelStats(key, width, window, half_life, bins)
+		self.lock = threading.Lock()
+
+	def push(self, packet):
+		key = packet_key(packet)
+		stats = self.channels.get((key, packet.get('eye')))
+		if stats is None or packet.get('s') != 0:
+			return
+		values = packet[key]
+		if key == 'pd':
+			values = (values,)
+		with self.lock:
+			stats.add(values, packet['ts'])
+
+	def get_stats(self, key, eye=None, percentiles=DEFAULT_PERCENTILES):
+		"""Returns one dictionary per component of the channel, {'window': ..., 'decayed': ...}."""
+		stats = self.channels[(key, eye)]
+		with self.lock:
+			return [{'window': w.get_stats(percentiles), 'decayed': d.get_stats(percentiles)}
+					for w, d in zip(stats.window, stats.decayed)]
+
+	def get_dispersion(self, key='gp', eye=None):
+		"""Dispersion of the window: sum over the components of (max - min)."""
+		stats = self.channels[(key, eye)]
+		with self.lock:
+			if stats.window[0].n == 0:
+				return float('nan')
+			return sum(w.maxs[0][1] - w.mins[0][1] for w in stats.window)